@@ -2,17 +2,60 @@ import streamlit as st
 import pandas as pd
 import datetime
 import os
-from sqlalchemy import create_engine, Column, Integer, String, Float, Date
+from sqlalchemy import create_engine, Column, Integer, String, Float, Date, DateTime, Text, UniqueConstraint
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy import event
 from werkzeug.security import generate_password_hash, check_password_hash
 import plotly.express as px
-from sqlalchemy import inspect, text
+from sqlalchemy import inspect, select, text
+from write_queue import WriteQueue
+from shards import ShardRouter
+from auth import AuthBusy, LoginThrottle, PasswordHasher
+from calendar_dim import BUCKETS, bucketed_totals, ensure_calendar
+from log_browser import FILTER_COLUMNS, apply_changes, diff_pages, fetch_page, filter_values
+from meal_planner import plan_meals
+from archive import ARCHIVED_TABLES, archive_all, archived_count, read_archived, reaches_archive, read_log
+from jobs import JobScheduler
+from backup import create_snapshot, list_snapshots, load_manifest
 
 # ----------------------
 # DATABASE SETUP
 # ----------------------
 DB_PATH = "/tmp/tracker.db"  # Streamlit Cloud writable path
-engine = create_engine(f"sqlite:///{DB_PATH}", connect_args={"check_same_thread": False})
+WRITE_BATCH_SIZE = int(os.environ.get("TRACKER_WRITE_BATCH_SIZE", 64))
+WRITE_MAX_LATENCY = float(os.environ.get("TRACKER_WRITE_MAX_LATENCY", 0.05))  # seconds
+# "single" keeps everything in DB_PATH; "sharded" gives each user their own log database
+STORAGE_MODE = os.environ.get("TRACKER_STORAGE_MODE", "single")
+SHARD_DIR = os.environ.get("TRACKER_SHARD_DIR", "/tmp/tracker_shards")
+# Stored hashes using other parameters are upgraded on the user's next login
+HASH_METHOD = os.environ.get("TRACKER_HASH_METHOD", "scrypt:32768:8:1")
+AUTH_WORKERS = int(os.environ.get("TRACKER_AUTH_WORKERS", 2))
+# Reverse proxies in front of the app that append to X-Forwarded-For; 0 = header not trusted
+TRUSTED_PROXIES = int(os.environ.get("TRACKER_TRUSTED_PROXIES", 0))
+# Log rows older than the horizon move to date-partitioned Parquet files
+ARCHIVE_DIR = os.environ.get("TRACKER_ARCHIVE_DIR", "/tmp/tracker_archive")
+ARCHIVE_HORIZON_DAYS = int(os.environ.get("TRACKER_ARCHIVE_HORIZON_DAYS", 365))
+JOB_WORKERS = int(os.environ.get("TRACKER_JOB_WORKERS", 2))
+JOB_RETENTION_DAYS = int(os.environ.get("TRACKER_JOB_RETENTION_DAYS", 7))  # finished jobs are purged after this
+# Point this at persistent storage in production; /tmp disappears with the container
+BACKUP_DIR = os.environ.get("TRACKER_BACKUP_DIR", "/tmp/tracker_backups")
+BACKUP_INTERVAL_HOURS = float(os.environ.get("TRACKER_BACKUP_INTERVAL_HOURS", 24))
+BACKUP_KEEP = int(os.environ.get("TRACKER_BACKUP_KEEP", 7))
+
+def make_engine(path):
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_conn, _):
+        # WAL lets readers keep going while the writer thread commits
+        cursor = dbapi_conn.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA busy_timeout=5000")
+        cursor.close()
+
+    return engine
+
+engine = make_engine(DB_PATH)
 Base = declarative_base()
 Session = sessionmaker(bind=engine)
 session = Session()
@@ -38,7 +81,7 @@ class User(Base):
     password_hash = Column(String)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = generate_password_hash(password, method=HASH_METHOD)
 
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
@@ -137,6 +180,71 @@ class RoutineExercise(Base):
     reps = Column(Integer)
     rest_time = Column(Integer)
 
+# ----------------------
+# CALENDAR DIMENSION
+# ----------------------
+class CalendarDay(Base):
+    __tablename__ = "calendar"
+    date = Column(Date, primary_key=True)
+    iso_year = Column(Integer)
+    iso_week = Column(Integer)
+    year_week = Column(String)       # e.g. "2024-W05"
+    month = Column(String)           # e.g. "2024-05"
+    training_block = Column(String)  # 4-week block, e.g. "2024-B02"
+
+class TrainingCycle(Base):
+    __tablename__ = "training_cycles"
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer)
+    name = Column(String)
+    phase = Column(String)  # Bulk, Cut, Cruise, ...
+    start_date = Column(Date)
+    end_date = Column(Date)
+
+# ----------------------
+# ARCHIVE BOOKKEEPING
+# ----------------------
+class ArchiveWatermark(Base):
+    __tablename__ = "archive_watermarks"
+    user_id = Column(Integer, primary_key=True)
+    table_name = Column(String, primary_key=True)
+    archived_before = Column(Date)  # rows dated before this live in Parquet
+
+class ArchiveRun(Base):
+    __tablename__ = "archive_runs"
+    user_id = Column(Integer, primary_key=True)
+    table_name = Column(String, primary_key=True)
+    run = Column(String, primary_key=True)  # part-<run>.parquet files readers may use
+
+class ArchiveRollup(Base):
+    __tablename__ = "archive_rollups"
+    __table_args__ = (UniqueConstraint("user_id", "table_name", "month"),)
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer)
+    table_name = Column(String)
+    month = Column(String)    # "YYYY-MM"
+    measure = Column(String)  # what `total` sums: amount, calories, volume, value
+    row_count = Column(Integer)
+    total = Column(Float)
+
+# ----------------------
+# BACKGROUND JOBS
+# ----------------------
+class Job(Base):
+    __tablename__ = "jobs"
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, nullable=True)  # Null for system-wide jobs
+    job_type = Column(String)
+    priority = Column(Integer, default=0)     # higher runs first
+    status = Column(String)                   # queued, running, done, failed
+    attempts = Column(Integer, default=0)
+    max_attempts = Column(Integer, default=3)
+    payload = Column(Text)                    # JSON
+    error = Column(Text)
+    run_after = Column(DateTime)
+    created_at = Column(DateTime)
+    updated_at = Column(DateTime)
+
 # ----------------------
 # CREATE TABLES
 # ----------------------
@@ -288,7 +396,104 @@ with engine.begin() as conn:
         conn.execute(text("ALTER TABLE exercises ADD COLUMN equipment STRING DEFAULT ''"))
     if 'secondary_muscles' not in columns:
         conn.execute(text("ALTER TABLE exercises ADD COLUMN secondary_muscles STRING DEFAULT ''"))
-        
+
+# ----------------------
+# SHARD ROUTER & WRITE QUEUE
+# ----------------------
+@st.cache_resource
+def get_shard_router():
+    if STORAGE_MODE != "sharded":
+        return None
+    return ShardRouter(SHARD_DIR, Base.metadata.sorted_tables, catalogue_engine=engine, engine_factory=make_engine)
+
+shard_router = get_shard_router()
+
+def log_engine_for(uid):
+    """Engine holding this user's log tables."""
+    return engine if shard_router is None else shard_router.engine_for(uid)
+
+@st.cache_resource
+def get_write_queue():
+    """One writer thread shared by every session; log inserts go through it."""
+    if shard_router is not None:
+        return WriteQueue(shard_router.session_for, max_batch=WRITE_BATCH_SIZE,
+                          max_latency=WRITE_MAX_LATENCY, shard_key=lambda obj: obj.user_id)
+    return WriteQueue(Session, max_batch=WRITE_BATCH_SIZE, max_latency=WRITE_MAX_LATENCY)
+
+write_queue = get_write_queue()
+
+def save_log(obj):
+    """Queue a log row and wait for its commit; a timed-out save is withdrawn, so retrying is safe."""
+    try:
+        return write_queue.add(obj)
+    except TimeoutError:
+        st.error("Saving is taking longer than usual and was cancelled; nothing was saved, please try again.")
+        st.stop()
+
+# ----------------------
+# AUTH WORKERS
+# ----------------------
+@st.cache_resource
+def get_password_hasher():
+    return PasswordHasher(method=HASH_METHOD, workers=AUTH_WORKERS,
+                          use_processes=os.environ.get("TRACKER_AUTH_PROCESSES") == "1")
+
+@st.cache_resource
+def get_login_throttle():
+    return LoginThrottle()
+
+password_hasher = get_password_hasher()
+login_throttle = get_login_throttle()
+
+# ----------------------
+# BACKGROUND JOB HANDLERS
+# ----------------------
+def thumbnail_path(path):
+    return os.path.join(os.path.dirname(path), "thumbs", os.path.basename(path))
+
+def run_archive_job(job_user_id, payload):
+    archive_all(log_engine_for(job_user_id), [m.__table__ for m in (Dose, MealLog, Workout, Bloodwork)],
+                [job_user_id], ARCHIVE_HORIZON_DAYS, ARCHIVE_DIR, ArchiveWatermark.__table__,
+                ArchiveRollup.__table__, ArchiveRun.__table__, log=lambda _: None)
+
+def run_thumbnail_job(job_user_id, payload):
+    from PIL import Image  # ships with streamlit
+    with log_engine_for(job_user_id).connect() as conn:
+        paths = conn.execute(select(Photo.path).where(Photo.user_id == job_user_id)).scalars().all()
+    for path in paths:
+        thumb = thumbnail_path(path)
+        if os.path.exists(thumb) or not os.path.exists(path):
+            continue
+        os.makedirs(os.path.dirname(thumb), exist_ok=True)
+        with Image.open(path) as img:
+            img.thumbnail((480, 480))
+            img.save(thumb)
+
+def run_backup_job(job_user_id, payload):
+    try:
+        os.makedirs(BACKUP_DIR, exist_ok=True)
+        create_snapshot(BACKUP_DIR, DB_PATH, SHARD_DIR if shard_router is not None else None, "photos", ARCHIVE_DIR,
+                        keep=BACKUP_KEEP)
+    finally:
+        # Schedule the next run; this job is still "running", so it isn't deduped away
+        job_scheduler.enqueue(None, "backup", delay=BACKUP_INTERVAL_HOURS * 3600)
+
+@st.cache_resource
+def get_job_scheduler():
+    scheduler = JobScheduler(engine, Job.__table__, workers=JOB_WORKERS, retention_days=JOB_RETENTION_DAYS)
+    scheduler.register("archive", run_archive_job)
+    scheduler.register("thumbnail", run_thumbnail_job)
+    scheduler.register("backup", run_backup_job)
+    scheduler.enqueue(None, "backup", delay=BACKUP_INTERVAL_HOURS * 3600)
+    return scheduler
+
+job_scheduler = get_job_scheduler()
+
+def enqueue_archive(uid):
+    # Low priority and delayed so a burst of saves collapses into one run; deferred so
+    # the save itself doesn't wait on a jobs-table write
+    job_scheduler.defer(uid, "archive", priority=-1, delay=60)
+
 # ----------------------
 # SESSION STATE INIT
 # ----------------------
@@ -316,6 +521,23 @@ if "user_email" not in st.session_state:
 if "page" not in st.session_state:
     st.session_state.page = "Dosing"
 
+def client_key():
+    """Best-effort identifier for the browser client, used for throttling."""
+    if TRUSTED_PROXIES:
+        # Clients can put anything in the header; only the entries our own proxies
+        # appended are trustworthy, and the outermost of those is the client address
+        try:
+            forwarded = [a.strip() for a in st.context.headers.get("X-Forwarded-For", "").split(",") if a.strip()]
+            if len(forwarded) >= TRUSTED_PROXIES:
+                return forwarded[-TRUSTED_PROXIES]
+        except Exception:
+            pass
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        return get_script_run_ctx().session_id
+    except Exception:
+        return "unknown"
+
 def login_user(user):
     """Set session state for logged in user."""
     st.session_state.logged_in = True
@@ -332,31 +554,47 @@ if not st.session_state.logged_in:
     st.sidebar.button("Register", key="register_btn")
 
     if auth_mode == "Register" and st.sidebar.button("Register"):
-        if email_input.strip() and password_input.strip():
+        wait = login_throttle.allow(email_input, client_key())
+        if wait:
+            st.sidebar.error(f"Too many attempts, try again in {int(wait) + 1}s")
+        elif email_input.strip() and password_input.strip():
             existing = session.query(User).filter_by(email=email_input).first()
             if existing:
                 st.sidebar.error("User already exists")
             else:
-                new_user = User(email=email_input)
-                new_user.set_password(password_input)
-                session.add(new_user)
-                session.commit()
-                st.sidebar.success("User registered! You can now log in.")
+                try:
+                    new_user = User(email=email_input, password_hash=password_hasher.hash(password_input))
+                    session.add(new_user)
+                    session.commit()
+                    st.sidebar.success("User registered! You can now log in.")
+                except AuthBusy as e:
+                    st.sidebar.error(str(e))
         else:
             st.sidebar.error("Enter email and password")
 
     if auth_mode == "Login" and st.sidebar.button("Login"):
-        user = session.query(User).filter_by(email=email_input).first()
-        if user and user.check_password(password_input):
-            login_user(user)
-            st.experimental_rerun()  # Safe rerun AFTER session state updates
+        wait = login_throttle.allow(email_input, client_key())
+        if wait:
+            st.sidebar.error(f"Too many login attempts, try again in {int(wait) + 1}s")
         else:
-            st.sidebar.error("Invalid credentials")
+            user = session.query(User).filter_by(email=email_input).first()
+            try:
+                ok, new_hash = password_hasher.verify(user.password_hash if user else None, password_input)
+                if ok:
+                    if new_hash:
+                        user.password_hash = new_hash
+                        session.commit()
+                    login_user(user)
+                    st.experimental_rerun()  # Safe rerun AFTER session state updates
+                else:
+                    st.sidebar.error("Invalid credentials")
+            except AuthBusy as e:
+                st.sidebar.error(str(e))
 
 # Show navigation menu if logged in
 else:
     st.sidebar.title("Navigation")
-    pages = ["Dosing", "Meals", "Workouts", "Bloodwork", "Photos", "Dashboard", "Logout"]
+    pages = ["Dosing", "Meals", "Workouts", "Bloodwork", "Photos", "Log Browser", "Dashboard", "Logout"]
     st.session_state.page = st.sidebar.selectbox(
     "Select Page",
     pages,
@@ -365,6 +603,13 @@ else:
 )
     st.sidebar.write(f"Logged in as: {st.session_state.user_email}")
 
+    job_counts = job_scheduler.status_counts(st.session_state.user_id)
+    if job_counts:
+        st.sidebar.caption(
+            f"Background jobs: {job_counts.get('queued', 0)} queued, "
+            f"{job_counts.get('running', 0)} running, {job_counts.get('failed', 0)} failed"
+        )
+
     # Logout logic
     if st.session_state.page == "Logout":
         st.session_state.logged_in = False
@@ -379,6 +624,40 @@ else:
 user_id = st.session_state.user_id
 page = st.session_state.page
 
+# Log tables are read from the user's shard when sharding is on
+log_engine = engine
+if shard_router is not None and user_id is not None:
+    log_engine = shard_router.engine_for(user_id)
+    session = shard_router.session_for(user_id)
+
+LOG_MODELS = [Dose, MealLog, Workout, Bloodwork, Photo, FoodItem]
+ensure_calendar(log_engine, CalendarDay.__table__, [m.__table__ for m in LOG_MODELS])
+
+HISTORY_WINDOWS = {"Last 3 Months": 91, "Last Year": 365, "All Time": None}
+
+def history_start(key):
+    """History selector; returns the first date to chart (None = all history)."""
+    days = HISTORY_WINDOWS[st.selectbox("History", list(HISTORY_WINDOWS), index=1, key=key)]
+    return None if days is None else datetime.date.today() - datetime.timedelta(days=days)
+
+def load_log(model, start=None, end=None):
+    """User's rows for a log table; archived Parquet is only read if the range reaches it."""
+    return read_log(log_engine, model.__table__, user_id, ARCHIVE_DIR, ArchiveWatermark.__table__,
+                    ArchiveRun.__table__, start, end)
+
+def bucket_totals(model, measures, by=(), key=None, start=None):
+    """Group-by selector plus calendar-joined totals for one log table."""
+    label = st.selectbox("Group By", list(BUCKETS), key=key)
+    archived = None
+    if reaches_archive(log_engine, ArchiveWatermark.__table__, model.__tablename__, user_id, start):
+        archived = read_archived(log_engine, model.__tablename__, user_id, ARCHIVE_DIR,
+                                 ArchiveWatermark.__table__, ArchiveRun.__table__, start)
+    summary = bucketed_totals(
+        log_engine, model.__table__, CalendarDay.__table__, user_id, measures,
+        by=by, bucket=BUCKETS[label], cycles=TrainingCycle.__table__, start=start, archived=archived,
+    )
+    return summary.rename(columns={"bucket": label}), label
+
 
 # ----------------------
 # DASHBOARD PAGE
@@ -386,17 +665,83 @@ page = st.session_state.page
 if st.session_state.logged_in and page == "Dashboard":
     st.header("Dashboard Overview")
     try:
-        doses = pd.read_sql(session.query(Dose).filter_by(user_id=user_id).statement, engine)
-        meals = pd.read_sql(session.query(MealLog).filter_by(user_id=user_id).statement, engine)
-        workouts = pd.read_sql(session.query(Workout).filter_by(user_id=user_id).statement, engine)
+        doses = pd.read_sql(session.query(Dose).filter_by(user_id=user_id).statement, log_engine)
+        meals = pd.read_sql(session.query(MealLog).filter_by(user_id=user_id).statement, log_engine)
+        workouts = pd.read_sql(session.query(Workout).filter_by(user_id=user_id).statement, log_engine)
     except Exception as e:
         st.error(f"Database read error: {e}")
         st.stop()
 
     col1, col2, col3 = st.columns(3)
-    col1.metric("Doses Logged", len(doses))
-    col2.metric("Meals Logged", len(meals))
-    col3.metric("Workouts Logged", len(workouts))
+    archived = {name: archived_count(log_engine, ArchiveRollup.__table__, name, user_id) for name in ARCHIVED_TABLES}
+    col1.metric("Doses Logged", len(doses) + archived["doses"])
+    col2.metric("Meals Logged", len(meals) + archived["meals"])
+    col3.metric("Workouts Logged", len(workouts) + archived["workouts"])
+
+    # Archived history is summarised per month; the rows themselves are in Parquet
+    st.subheader("Archived History")
+    st.caption(f"Logs older than {ARCHIVE_HORIZON_DAYS} days are moved to the archive.")
+    if st.button("Archive Old Logs", key="archive_btn"):
+        job_scheduler.enqueue(user_id, "archive", priority=1)
+        st.success("Archiving queued; it runs in the background.")
+    rollups = pd.read_sql(session.query(ArchiveRollup).filter_by(user_id=user_id).statement, log_engine)
+    if not rollups.empty:
+        st.dataframe(rollups[["table_name", "month", "row_count", "measure", "total"]])
+
+    # Training cycles drive the "Cycle Phase" grouping on every chart
+    st.subheader("Training Cycles")
+    with st.expander("Add Cycle"):
+        cycle_name = st.text_input("Cycle Name", key="cycle_name")
+        cycle_phase = st.selectbox("Phase", ["Bulk", "Cut", "Maintenance", "Cruise", "Blast", "PCT", "Deload"], key="cycle_phase")
+        cycle_start = st.date_input("Start", datetime.date.today(), key="cycle_start")
+        cycle_end = st.date_input("End", datetime.date.today() + datetime.timedelta(weeks=12), key="cycle_end")
+        if st.button("Save Cycle", key="save_cycle_btn"):
+            overlapping = session.query(TrainingCycle).filter(
+                TrainingCycle.user_id == user_id,
+                TrainingCycle.start_date <= cycle_end,
+                TrainingCycle.end_date >= cycle_start,
+            ).first()
+            if cycle_end < cycle_start:
+                st.error("Cycle must end after it starts")
+            elif overlapping:
+                st.error(f"Cycle overlaps {overlapping.name} ({overlapping.start_date} to {overlapping.end_date})")
+            else:
+                save_log(TrainingCycle(user_id=user_id, name=cycle_name or cycle_phase, phase=cycle_phase,
+                                       start_date=cycle_start, end_date=cycle_end))
+                st.success("Cycle saved!")
+    cycles = pd.read_sql(session.query(TrainingCycle).filter_by(user_id=user_id).statement, log_engine)
+    if not cycles.empty:
+        st.dataframe(cycles[["name", "phase", "start_date", "end_date"]])
+
+    # Background jobs
+    recent_jobs = job_scheduler.recent(user_id)
+    if recent_jobs:
+        st.subheader("Background Jobs")
+        st.dataframe(pd.DataFrame(recent_jobs)[["job_type", "status", "attempts", "error", "updated_at"]])
+
+    # Backups
+    st.subheader("Backups")
+    snapshots = list_snapshots(BACKUP_DIR) if os.path.isdir(BACKUP_DIR) else []
+    if snapshots:
+        last_backup = load_manifest(snapshots[-1])
+        b1, b2, b3 = st.columns(3)
+        b1.metric("Last Backup", datetime.datetime.strptime(last_backup["created"], "%Y%m%dT%H%M%S%f").strftime("%Y-%m-%d %H:%M"))
+        b2.metric("Longest Lock (ms)", f"{last_backup['metrics']['max_step_ms']:.1f}")
+        b3.metric("Snapshots Kept", len(snapshots))
+    else:
+        st.caption("No backups yet.")
+    if st.button("Back Up Now", key="backup_btn"):
+        job_scheduler.enqueue(None, "backup", priority=2)
+        st.success("Backup queued; it runs in the background.")
+
+    # Write queue health
+    wq = write_queue.metrics()
+    st.subheader("Write Queue")
+    q1, q2, q3, q4 = st.columns(4)
+    q1.metric("Queue Depth", wq["queue_depth"])
+    q2.metric("Avg Batch Size", f"{wq['avg_batch']:.1f}")
+    q3.metric("Commit p95 (ms)", f"{wq['commit_ms_p95']:.1f}")
+    q4.metric("Save Ack p95 (ms)", f"{wq['ack_ms_p95']:.1f}")
 
     # ----------------------
     # DOSING PAGE
@@ -511,33 +856,31 @@ if st.session_state.logged_in and page == "Dosing":
         if compound_name.strip() == "" or amount <= 0:
             st.error("Please enter a valid compound and amount")
         else:
-            session.add(Dose(user_id=user_id, compound=compound_name, amount=amount, date=date))
-            session.commit()
+            save_log(Dose(user_id=user_id, compound=compound_name, amount=amount, date=date))
+            enqueue_archive(user_id)
             st.success("Dose saved!")
 
     # ----------------------
     # Graph Style Selector
     # ----------------------
     graph_type = st.selectbox("Graph Type", ["Bar","Line","Area"])
+    start = history_start("dose_history")
 
     # Fetch doses
-    doses = pd.read_sql(
-        session.query(Dose).filter_by(user_id=user_id).statement,
-        engine
-    )
+    doses = load_log(Dose, start)
 
     if doses.empty:
         st.info("No doses logged yet.")
     else:
         if "amount" in doses.columns and "compound" in doses.columns and "date" in doses.columns:
-            doses["week"] = pd.to_datetime(doses["date"]).dt.isocalendar().week
-            summary = doses.groupby(["week","compound"])["amount"].sum().reset_index()
+            summary, bucket = bucket_totals(Dose, {"amount": lambda c: c.amount}, by=("compound",), key="dose_bucket", start=start)
+            title = f"Dose Totals by {bucket}"
             if graph_type == "Bar":
-                fig = px.bar(summary, x="week", y="amount", color="compound", title="Weekly Dose Totals")
+                fig = px.bar(summary, x=bucket, y="amount", color="compound", title=title)
             elif graph_type == "Line":
-                fig = px.line(summary, x="week", y="amount", color="compound", title="Weekly Dose Totals")
+                fig = px.line(summary, x=bucket, y="amount", color="compound", title=title)
             else:
-                fig = px.area(summary, x="week", y="amount", color="compound", title="Weekly Dose Totals")
+                fig = px.area(summary, x=bucket, y="amount", color="compound", title=title)
             st.plotly_chart(fig)
         else:
             st.error("Dose table missing expected columns.")
@@ -562,7 +905,7 @@ if st.session_state.logged_in and page == "Meals":
     # Fetch user foods
     user_foods = pd.read_sql(
         session.query(FoodItem).filter_by(user_id=user_id).statement,
-        engine
+        log_engine
     )
     user_food_dict = {
         row["name"]: {"Calories": row["calories"], "Protein": row["protein"], "Carbs": row["carbs"], "Fats": row["fats"]}
@@ -606,7 +949,7 @@ if st.session_state.logged_in and page == "Meals":
             if food_choice == "Add Custom Food":
                 exists = session.query(FoodItem).filter_by(name=food_name, user_id=user_id).first()
                 if not exists:
-                    session.add(FoodItem(
+                    save_log(FoodItem(
                         user_id=user_id,
                         name=food_name,
                         calories=calories,
@@ -614,11 +957,10 @@ if st.session_state.logged_in and page == "Meals":
                         carbs=carbs,
                         fats=fats
                     ))
-                    session.commit()
                     st.success(f"Custom food '{food_name}' saved!")
 
             # Log the meal
-            session.add(MealLog(
+            save_log(MealLog(
                 user_id=user_id,
                 meal=food_name,
                 calories=calories*quantity,
@@ -627,22 +969,50 @@ if st.session_state.logged_in and page == "Meals":
                 fats=fats*quantity,
                 date=date
             ))
-            session.commit()
+            enqueue_archive(user_id)
             st.success(f"{food_name} logged!")
 
+    # -----------------------
+    # MEAL PLANNER
+    # -----------------------
+    with st.expander("Plan Meals for Macro Targets"):
+        t1, t2, t3, t4 = st.columns(4)
+        plan_targets = {
+            "Calories": t1.number_input("Calories", min_value=0, value=2500, step=50, key="plan_calories"),
+            "Protein": t2.number_input("Protein (g)", min_value=0, value=180, step=5, key="plan_protein"),
+            "Carbs": t3.number_input("Carbs (g)", min_value=0, value=250, step=5, key="plan_carbs"),
+            "Fats": t4.number_input("Fats (g)", min_value=0, value=80, step=5, key="plan_fats"),
+        }
+        p1, p2 = st.columns(2)
+        foods_per_plan = p1.slider("Foods per Plan", 2, 6, 4, key="plan_foods")  # 2-6 covered by bench_meal_planner.py
+        max_servings = p2.slider("Max Servings per Food", 1, 15, 8, key="plan_max_servings")
+        if st.button("Generate Plans", key="plan_btn"):
+            if not any(plan_targets.values()):
+                st.error("Set at least one macro target above zero")
+                plans = []
+            else:
+                plans = plan_meals(all_foods, plan_targets, foods_per_plan=foods_per_plan, max_servings=max_servings)
+                if not plans:
+                    st.info("No plan found; add more foods or loosen the targets.")
+            for rank, plan in enumerate(plans, 1):
+                st.write(f"**Plan {rank}**")
+                st.dataframe(pd.DataFrame(
+                    [{"Food": name, "Servings": servings, **{m: all_foods[name][m] * servings for m in plan_targets}}
+                     for name, servings in plan["servings"].items()]
+                ))
+                st.caption(" | ".join(
+                    f"{m}: {plan['totals'][m]:.0f} / {plan_targets[m]}" for m in plan_targets
+                ))
+
     # -----------------------
     # FETCH LOGGED MEALS
     # -----------------------
-    meals = pd.read_sql(
-        session.query(MealLog).filter_by(user_id=user_id).statement,
-        engine
-    )
+    start = history_start("meal_history")
+    meals = load_log(MealLog, start)
 
     if meals.empty:
         st.info("No meals logged yet.")
     else:
-        meals["week"] = pd.to_datetime(meals["date"]).dt.isocalendar().week
-
         # Daily Pie Chart
         st.subheader("Today's Macro Breakdown")
         today = datetime.date.today()
@@ -670,14 +1040,17 @@ if st.session_state.logged_in and page == "Meals":
         st.plotly_chart(fig_daily)
 
         # Weekly stacked macro chart
-        st.subheader("Weekly Macros")
-        weekly_summary = meals.groupby("week")[["protein","carbs","fats"]].sum().reset_index()
+        st.subheader("Macros by Period")
+        weekly_summary, bucket = bucket_totals(
+            MealLog, {"protein": lambda c: c.protein, "carbs": lambda c: c.carbs, "fats": lambda c: c.fats},
+            key="meal_bucket", start=start
+        )
         fig_weekly = px.bar(
             weekly_summary,
-            x="week",
+            x=bucket,
             y=["protein","carbs","fats"],
-            title="Weekly Macros",
-            labels={"value":"Grams", "week":"Week"},
+            title=f"Macros by {bucket}",
+            labels={"value":"Grams"},
             color_discrete_map={"protein":"#EF553B","carbs":"#636EFA","fats":"#00CC96"}
         )
         st.plotly_chart(fig_weekly)
@@ -759,7 +1132,7 @@ with col2:
     # Save workout
     # ----------------------
     if st.button("Save Workout"):
-        session.add(Workout(
+        save_log(Workout(
             user_id=user_id,
             exercise=exercise,
             sets=int(sets),
@@ -769,32 +1142,29 @@ with col2:
             goal=goal,
             date=date
         ))
-        session.commit()
+        enqueue_archive(user_id)
         st.success("Workout saved!")
 
     # ----------------------
     # Display workout summary
     # ----------------------
     try:
-        workouts_df = pd.read_sql(
-            session.query(Workout).filter_by(user_id=user_id).statement,
-            engine
-        )
+        start = history_start("workout_history")
+        workouts_df = load_log(Workout, start)
     except Exception:
         st.error("Unable to load workouts. Check database setup.")
         st.stop()
 
     if not workouts_df.empty:
-        workouts_df["volume"] = workouts_df["sets"] * workouts_df["reps"] * workouts_df["weight"]
-        workouts_df["week"] = pd.to_datetime(workouts_df["date"]).dt.isocalendar().week
-
-        weekly_summary = workouts_df.groupby(["week","exercise"])["volume"].sum().reset_index()
+        weekly_summary, bucket = bucket_totals(
+            Workout, {"volume": lambda c: c.sets * c.reps * c.weight}, by=("exercise",), key="workout_bucket", start=start
+        )
         fig = px.bar(
             weekly_summary,
-            x="week",
+            x=bucket,
             y="volume",
             color="exercise",
-            title="Weekly Workout Volume"
+            title=f"Workout Volume by {bucket}"
         )
         st.plotly_chart(fig)
     else:
@@ -830,11 +1200,11 @@ if st.session_state.logged_in and page == "Bloodwork":
     date = st.date_input("Date", datetime.date.today())
 
     if st.button("Save Bloodwork"):
-        session.add(Bloodwork(user_id=user_id, test=test, value=value, date=date))
-        session.commit()
+        save_log(Bloodwork(user_id=user_id, test=test, value=value, date=date))
+        enqueue_archive(user_id)
         st.success("Bloodwork saved!")
 
-    blood = pd.read_sql(session.query(Bloodwork).filter_by(user_id=user_id).statement, engine)
+    blood = load_log(Bloodwork, history_start("blood_history"))
     if not blood.empty:
         fig = px.line(blood, x="date", y="value", color="test", title="Bloodwork Trends")
         st.plotly_chart(fig)
@@ -854,10 +1224,70 @@ if st.session_state.logged_in and page == "Photos":
         path = f"photos/{user_id}_{date}_{uploaded.name}"
         with open(path, "wb") as f:
             f.write(uploaded.getbuffer())
-        session.add(Photo(user_id=user_id, path=path, date=date))
-        session.commit()
+        save_log(Photo(user_id=user_id, path=path, date=date))
+        job_scheduler.defer(user_id, "thumbnail", priority=1)
         st.success("Photo saved!")
 
     photos = session.query(Photo).filter_by(user_id=user_id).all()
     for p in photos:
-        st.image(p.path, caption=str(p.date))
+        thumb = thumbnail_path(p.path)
+        st.image(thumb if os.path.exists(thumb) else p.path, caption=str(p.date))
+
+# ----------------------
+# LOG BROWSER PAGE
+# ----------------------
+if st.session_state.logged_in and page == "Log Browser":
+    st.header("Log Browser")
+    browse_models = {"Doses": Dose, "Meals": MealLog, "Workouts": Workout, "Bloodwork": Bloodwork}
+    browse_model = browse_models[st.selectbox("Log", list(browse_models), key="browse_table")]
+    table = browse_model.__table__
+
+    col1, col2, col3 = st.columns(3)
+    start = col1.date_input("From", value=None, key="browse_start")
+    end = col2.date_input("To", value=None, key="browse_end")
+    filter_col = FILTER_COLUMNS[table.name]
+    values = col3.multiselect(filter_col.title(), filter_values(log_engine, table, user_id), key="browse_values")
+
+    # Stack of (date, id) cursors, one per page visited; reset when the filters change
+    filter_key = (table.name, start, end, tuple(values))
+    if st.session_state.get("browse_filter_key") != filter_key:
+        st.session_state.browse_filter_key = filter_key
+        st.session_state.browse_cursors = [None]
+    cursors = st.session_state.browse_cursors
+
+    # Archived rows can't be edited here, but they are included in the export
+    if st.button("Prepare CSV Export", key="browse_export_btn"):
+        export = load_log(browse_model, start, end)
+        if values:
+            export = export[export[filter_col].isin(values)]
+        st.download_button("Download CSV", export.drop(columns=["user_id"]).to_csv(index=False),
+                           file_name=f"{table.name}.csv", mime="text/csv", key="browse_export")
+
+    if "browse_notice" in st.session_state:
+        st.success(st.session_state.pop("browse_notice"))
+
+    rows, next_cursor = fetch_page(log_engine, table, user_id, after=cursors[-1], start=start, end=end, values=values)
+    if rows.empty:
+        st.info("No rows match these filters.")
+    else:
+        edited = st.data_editor(
+            rows.drop(columns=["user_id"]).assign(delete=False),
+            key=f"browse_grid_{table.name}_{len(cursors)}",
+            disabled=["id"],
+            hide_index=True,
+            column_config={"delete": st.column_config.CheckboxColumn("Delete")},
+        )
+        if st.button("Apply Changes", key="browse_apply"):
+            updates, deletes = diff_pages(rows, edited)
+            updated, deleted = apply_changes(log_engine, table, user_id, updates, deletes)
+            st.session_state.browse_notice = f"{updated} rows updated, {deleted} rows deleted"
+            st.experimental_rerun()
+
+    nav1, nav2, nav3 = st.columns(3)
+    if nav1.button("Newer", disabled=len(cursors) == 1, key="browse_newer"):
+        cursors.pop()
+        st.experimental_rerun()
+    nav2.write(f"Page {len(cursors)}")
+    if nav3.button("Older", disabled=next_cursor is None, key="browse_older"):
+        cursors.append(next_cursor)
+        st.experimental_rerun()
@@ -0,0 +1,228 @@
+import argparse
+import datetime
+import glob
+import os
+import time
+
+import pandas as pd
+from sqlalchemy import MetaData, create_engine, func, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+# ----------------------
+# HOT/COLD ARCHIVE
+# ----------------------
+# Log rows older than the archive horizon are moved out of SQLite into
+# Parquet files partitioned by table, user and month:
+#
+#   <archive_dir>/<table>/user_id=<id>/month=<YYYY-MM>/part-<run>.parquet
+#
+# A per-user watermark records how far each table has been archived, so reads
+# only open Parquet files when the requested date range reaches below it.
+# Monthly row counts and totals stay in SQLite as rollups.
+#
+# Each archive run writes its files first, then deletes the rows and records
+# the run in one transaction. Readers only open files of recorded runs, so a
+# crash in between leaves rows that are still only in SQLite as far as any
+# reader can tell; row ids are never compared, since SQLite reuses them.
+
+ARCHIVED_TABLES = ("doses", "meals", "workouts", "bloodwork")
+
+# Table -> (rollup measure name, how to compute it from archived rows)
+ROLLUP_MEASURES = {
+    "doses": ("amount", lambda rows: rows["amount"]),
+    "meals": ("calories", lambda rows: rows["calories"]),
+    "workouts": ("volume", lambda rows: rows["sets"] * rows["reps"] * rows["weight"]),
+    "bloodwork": ("value", lambda rows: rows["value"]),
+}
+DELETE_CHUNK = 500  # stay well under SQLite's bound-parameter limit
+ORPHAN_AGE = 3600  # seconds before files of an unrecorded run are treated as crash leftovers
+
+
+def partition_dir(archive_dir, table_name, user_id, month):
+    return os.path.join(archive_dir, table_name, f"user_id={int(user_id)}", f"month={month}")
+
+
+def watermark(engine, watermarks, table_name, user_id):
+    """First date still held in SQLite; rows before it live in Parquet (None if nothing is archived)."""
+    with engine.connect() as conn:
+        return conn.execute(
+            select(watermarks.c.archived_before)
+            .where(watermarks.c.user_id == user_id, watermarks.c.table_name == table_name)
+        ).scalar()
+
+
+def _part_files(archive_dir, table_name, user_id):
+    """(run, month, path) for every Parquet part of the user's table."""
+    parts = []
+    for path in sorted(glob.glob(os.path.join(partition_dir(archive_dir, table_name, user_id, "*"), "part-*.parquet"))):
+        month = os.path.basename(os.path.dirname(path)).split("=", 1)[1]
+        run = os.path.basename(path)[len("part-"):-len(".parquet")]
+        parts.append((run, month, path))
+    return parts
+
+
+def committed_runs(engine, table_name, user_id, archive_dir, watermarks, runs):
+    """Runs whose rows were deleted from SQLite, i.e. whose Parquet files readers may use.
+
+    Archives written before runs were recorded have a watermark but no runs;
+    their files are adopted as committed the first time they are seen.
+    """
+    where = (runs.c.user_id == user_id, runs.c.table_name == table_name)
+    with engine.connect() as conn:
+        recorded = set(conn.execute(select(runs.c.run).where(*where)).scalars())
+    if recorded or watermark(engine, watermarks, table_name, user_id) is None:
+        return recorded
+    legacy = {run for run, _, _ in _part_files(archive_dir, table_name, user_id)}
+    if legacy:
+        with engine.begin() as conn:
+            conn.execute(sqlite_insert(runs).on_conflict_do_nothing(), [
+                {"user_id": user_id, "table_name": table_name, "run": run} for run in sorted(legacy)
+            ])
+    return legacy
+
+
+def archive_user(engine, table, user_id, before, archive_dir, watermarks, rollups, runs):
+    """Move the user's rows dated before `before` into Parquet. Returns rows archived.
+
+    Files are written before the rows are deleted and the run recorded; if we
+    die in between, readers ignore the files and a later run removes them.
+    """
+    measure_name, measure = ROLLUP_MEASURES[table.name]
+    committed = committed_runs(engine, table.name, user_id, archive_dir, watermarks, runs)
+    for run, _, path in _part_files(archive_dir, table.name, user_id):
+        # Not recorded and not written just now by a concurrent run: a crash leftover
+        if run not in committed and time.time() - os.path.getmtime(path) > ORPHAN_AGE:
+            os.remove(path)
+
+    with engine.connect() as conn:
+        rows = pd.DataFrame(
+            conn.execute(select(table).where(table.c.user_id == user_id, table.c.date < before)).mappings().all(),
+            columns=[c.name for c in table.columns],
+        )
+    if not rows.empty:
+        rows["month"] = pd.to_datetime(rows["date"]).dt.strftime("%Y-%m")
+        run = str(time.time_ns())
+        for month, part in rows.groupby("month"):
+            path = partition_dir(archive_dir, table.name, user_id, month)
+            os.makedirs(path, exist_ok=True)
+            target = os.path.join(path, f"part-{run}.parquet")
+            part.drop(columns=["month"]).to_parquet(target + ".tmp", index=False)
+            os.replace(target + ".tmp", target)
+
+    with engine.begin() as conn:
+        if not rows.empty:
+            summary = rows.assign(measure=measure(rows).fillna(0.0)).groupby("month")["measure"].agg(["count", "sum"])
+            for month, (count, total) in summary.iterrows():
+                count, total = int(count), float(total)
+                stmt = sqlite_insert(rollups).values(
+                    user_id=user_id, table_name=table.name, month=month,
+                    measure=measure_name, row_count=count, total=total,
+                )
+                conn.execute(stmt.on_conflict_do_update(
+                    index_elements=["user_id", "table_name", "month"],
+                    set_={"row_count": rollups.c.row_count + count, "total": rollups.c.total + total},
+                ))
+            ids = rows["id"].tolist()
+            deleted = 0
+            for i in range(0, len(ids), DELETE_CHUNK):
+                deleted += conn.execute(table.delete().where(table.c.id.in_(ids[i:i + DELETE_CHUNK]))).rowcount
+            if deleted != len(ids):
+                # Another run archived (or someone deleted) some of these rows meanwhile;
+                # roll back so this run's files stay unrecorded
+                raise RuntimeError(f"{table.name}: rows for user {user_id} changed while archiving, retry")
+            conn.execute(runs.insert().values(user_id=user_id, table_name=table.name, run=run))
+        stmt = sqlite_insert(watermarks).values(user_id=user_id, table_name=table.name, archived_before=before)
+        conn.execute(stmt.on_conflict_do_update(
+            index_elements=["user_id", "table_name"],
+            set_={"archived_before": func.max(watermarks.c.archived_before, before)},
+        ))
+    return len(rows)
+
+
+def read_archived(engine, table_name, user_id, archive_dir, watermarks, runs, start=None, end=None):
+    """Rows from committed runs' Parquet partitions whose month overlaps [start, end]."""
+    first = start.strftime("%Y-%m") if start else None
+    last = end.strftime("%Y-%m") if end else None
+    committed = committed_runs(engine, table_name, user_id, archive_dir, watermarks, runs)
+    frames = []
+    for run, month, path in _part_files(archive_dir, table_name, user_id):
+        if run not in committed or (first and month < first) or (last and month > last):
+            continue
+        frames.append(pd.read_parquet(path))
+    if not frames:
+        return pd.DataFrame()
+    rows = pd.concat(frames, ignore_index=True)
+    rows["date"] = pd.to_datetime(rows["date"]).dt.date
+    if start:
+        rows = rows[rows["date"] >= start]
+    if end:
+        rows = rows[rows["date"] <= end]
+    return rows
+
+
+def reaches_archive(engine, watermarks, table_name, user_id, start=None):
+    """True if a read starting at `start` (None = all history) needs archived rows."""
+    mark = watermark(engine, watermarks, table_name, user_id)
+    return mark is not None and (start is None or start < mark)
+
+
+def read_log(engine, table, user_id, archive_dir, watermarks, runs, start=None, end=None):
+    """User's rows in [start, end] from SQLite, plus Parquet partitions only if the range reaches them."""
+    conditions = [table.c.user_id == user_id]
+    if start:
+        conditions.append(table.c.date >= start)
+    if end:
+        conditions.append(table.c.date <= end)
+    with engine.connect() as conn:
+        hot = pd.DataFrame(conn.execute(select(table).where(*conditions)).mappings().all(),
+                           columns=[c.name for c in table.columns])
+    if not reaches_archive(engine, watermarks, table.name, user_id, start):
+        return hot
+    cold = read_archived(engine, table.name, user_id, archive_dir, watermarks, runs, start, end)
+    if cold.empty:
+        return hot
+    return pd.concat([cold, hot], ignore_index=True).sort_values(["date", "id"], ignore_index=True)
+
+
+def archived_count(engine, rollups, table_name, user_id):
+    with engine.connect() as conn:
+        return conn.execute(
+            select(func.coalesce(func.sum(rollups.c.row_count), 0))
+            .where(rollups.c.user_id == user_id, rollups.c.table_name == table_name)
+        ).scalar()
+
+
+def archive_all(engine, tables, user_ids, horizon_days, archive_dir, watermarks, rollups, runs, log=print):
+    before = datetime.date.today() - datetime.timedelta(days=horizon_days)
+    total = 0
+    for user_id in user_ids:
+        for table in tables:
+            moved = archive_user(engine, table, user_id, before, archive_dir, watermarks, rollups, runs)
+            if moved:
+                log(f"user {user_id} {table.name}: {moved} rows archived")
+            total += moved
+    return total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move log rows older than the horizon into Parquet.")
+    parser.add_argument("--db", default="/tmp/tracker.db", help="tracker database or a user shard")
+    parser.add_argument("--archive-dir", default="/tmp/tracker_archive")
+    parser.add_argument("--horizon-days", type=int, default=365)
+    parser.add_argument("--user-id", type=int, action="append", help="limit to these users (default: all)")
+    args = parser.parse_args()
+
+    engine = create_engine(f"sqlite:///{args.db}")
+    metadata = MetaData()
+    metadata.reflect(engine)
+    tables = [metadata.tables[name] for name in ARCHIVED_TABLES if name in metadata.tables]
+    user_ids = args.user_id
+    if not user_ids:
+        with engine.connect() as conn:
+            user_ids = sorted({
+                user_id for table in tables
+                for user_id in conn.execute(select(table.c.user_id).distinct()).scalars()
+                if user_id is not None
+            })
+    archive_all(engine, tables, user_ids, args.horizon_days, args.archive_dir,
+                metadata.tables["archive_watermarks"], metadata.tables["archive_rollups"], metadata.tables["archive_runs"])
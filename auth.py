@@ -0,0 +1,129 @@
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+# ----------------------
+# PASSWORD HASHING
+# ----------------------
+# Password hashing is deliberately slow, so it runs in a small bounded pool
+# instead of on the Streamlit script thread. hashlib's scrypt/pbkdf2 release
+# the GIL, so threads are enough; a process pool is available for hosts where
+# that isn't true.
+
+DEFAULT_HASH_METHOD = "scrypt:32768:8:1"
+
+
+def hash_method_of(password_hash):
+    return (password_hash or "").split("$", 1)[0]
+
+
+def _verify(password_hash, password, method):
+    ok = check_password_hash(password_hash, password)
+    if ok and hash_method_of(password_hash) != method:
+        # Parameters changed since this hash was made: upgrade it while we
+        # still have the plaintext.
+        return True, generate_password_hash(password, method=method)
+    return ok, None
+
+
+class AuthBusy(Exception):
+    """Raised when too many hash jobs are already waiting for the pool, or one waits too long."""
+
+
+class PasswordHasher:
+    """Bounded worker pool for password hashing and verification."""
+
+    def __init__(self, method=DEFAULT_HASH_METHOD, workers=2, max_pending=32, use_processes=False):
+        # Normalise e.g. "scrypt" to "scrypt:32768:8:1" so rehash checks compare like with like
+        self.method = hash_method_of(generate_password_hash("", method=method))
+        executor = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+        self._pool = executor(max_workers=workers)
+        self._slots = threading.BoundedSemaphore(workers + max_pending)
+        # Verified against when the email is unknown, so a miss costs the same as a hit
+        self._dummy_hash = generate_password_hash("not-a-password", method=self.method)
+
+    def _submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise AuthBusy("Too many login attempts in progress, try again shortly")
+        future = self._pool.submit(fn, *args)
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    @staticmethod
+    def _result(future, timeout):
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            future.cancel()  # still queued: don't spend a worker on a login nobody is waiting for
+            raise AuthBusy("Password check is taking too long, try again shortly") from None
+
+    def hash(self, password, timeout=30):
+        return self._result(self._submit(generate_password_hash, password, self.method), timeout)
+
+    def verify(self, password_hash, password, timeout=30):
+        """Return (ok, new_hash); new_hash is set when the stored hash should be replaced."""
+        if not password_hash:
+            self._result(self._submit(_verify, self._dummy_hash, password, self.method), timeout)
+            return False, None
+        return self._result(self._submit(_verify, password_hash, password, self.method), timeout)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True)
+
+
+# ----------------------
+# LOGIN THROTTLING
+# ----------------------
+class TokenBucket:
+    """Per-key token buckets: `capacity` attempts in a burst, refilled at `rate` per second."""
+
+    def __init__(self, capacity, rate):
+        self.capacity = capacity
+        self.rate = rate
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def allow(self, key, cost=1.0):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - updated) * self.rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > 10000:
+                self._prune(now)
+            return allowed
+
+    def retry_after(self, key, cost=1.0):
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (self.capacity, time.monotonic()))
+        tokens = min(self.capacity, tokens + (time.monotonic() - updated) * self.rate)
+        return max(0.0, (cost - tokens) / self.rate)
+
+    def _prune(self, now):
+        # Buckets that have refilled completely carry no state worth keeping
+        full = [k for k, (tokens, updated) in self._buckets.items()
+                if tokens + (now - updated) * self.rate >= self.capacity]
+        for k in full:
+            del self._buckets[k]
+
+
+class LoginThrottle:
+    """Throttles login attempts both per email and per client."""
+
+    def __init__(self, email_capacity=5, email_rate=1 / 60, client_capacity=20, client_rate=1 / 6):
+        self.by_email = TokenBucket(email_capacity, email_rate)
+        self.by_client = TokenBucket(client_capacity, client_rate)
+
+    def allow(self, email, client):
+        """Return 0 when the attempt may proceed, else seconds to wait."""
+        email = (email or "").strip().lower()
+        if not self.by_client.allow(client):
+            return self.by_client.retry_after(client)
+        if not self.by_email.allow(email):
+            return self.by_email.retry_after(email)
+        return 0.0
@@ -0,0 +1,349 @@
+import argparse
+import datetime
+import glob
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import tarfile
+import tempfile
+import time
+
+# ----------------------
+# ONLINE BACKUP & RESTORE
+# ----------------------
+# Databases are copied with SQLite's online backup API a few pages at a time,
+# pausing between steps so writers are never locked out for long; a plain
+# file copy can catch a half-written page. Each snapshot lives in its own
+# directory:
+#
+#   <backup_dir>/<stamp>/tracker.db.gz        catalogue / single-file database
+#   <backup_dir>/<stamp>/shards/user_N.db.gz  per-user shards, if any
+#   <backup_dir>/<stamp>/photos.tar.gz        photos added or changed since the last snapshot
+#   <backup_dir>/<stamp>/archive.tar.gz       archived-log Parquet files added since the last snapshot
+#   <backup_dir>/<stamp>/manifest.json        checksums, file locations, timings
+#
+# Photos and the Parquet archive are incremental: the manifest lists every
+# file and which snapshot's tarball holds it, so restoring one snapshot may
+# read tarballs from older ones. Pruning keeps those tarballs alive while any
+# kept snapshot needs them.
+
+MANIFEST = "manifest.json"
+PHOTO_MANIFEST = "photos-manifest.json"  # manifest of a pruned snapshot kept only for its tarballs
+PHOTO_ARCHIVE = "photos.tar.gz"
+SKIP_PHOTO_DIRS = ("thumbs",)  # regenerated by background jobs
+
+# File trees backed up incrementally: manifest key -> (tarball, manifest key of its checksum)
+TREES = {
+    "photos": (PHOTO_ARCHIVE, "photo_archive_sha256"),
+    "archive": ("archive.tar.gz", "archive_tarball_sha256"),
+}
+
+
+def sha256_file(path, chunk=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class _Restarted(Exception):
+    pass
+
+
+def online_copy(src_path, dest_path, pages=256, pause=0.005, max_restarts=3):
+    """Copy a live SQLite database with the backup API; returns lock timing metrics.
+
+    Each step holds the source's read lock for `pages` pages; between steps we
+    sleep `pause` seconds so queued writers get in. SQLite restarts a stepped
+    backup whenever another connection writes to the source, so under steady
+    writes it may never finish; after `max_restarts` we copy in one step
+    instead, which in WAL mode only pins a read snapshot and doesn't block
+    writers either.
+    """
+    steps = []
+    last = [time.perf_counter()]
+    restarts = [0]
+    previous = [None]
+
+    def progress(status, remaining, total):
+        now = time.perf_counter()
+        steps.append((now - last[0]) * 1000)
+        if previous[0] is not None and remaining > previous[0]:
+            restarts[0] += 1
+            if restarts[0] > max_restarts:
+                raise _Restarted()
+        previous[0] = remaining
+        time.sleep(pause)
+        last[0] = time.perf_counter()
+
+    started = time.perf_counter()
+    src = sqlite3.connect(src_path)
+    dest = sqlite3.connect(dest_path)
+    single_step = False
+    try:
+        try:
+            src.backup(dest, pages=pages, progress=progress)
+        except _Restarted:
+            single_step = True
+            last[0] = time.perf_counter()
+            src.backup(dest, pages=-1)
+            steps.append((time.perf_counter() - last[0]) * 1000)
+    finally:
+        dest.close()
+        src.close()
+    return {
+        "steps": len(steps),
+        "restarts": restarts[0],
+        "single_step": single_step,
+        "max_step_ms": max(steps, default=0.0),
+        "locked_ms": sum(steps),
+        "elapsed_ms": (time.perf_counter() - started) * 1000,
+    }
+
+
+def _compress(path, dest):
+    with open(path, "rb") as f, gzip.open(dest, "wb", compresslevel=6) as out:
+        shutil.copyfileobj(f, out)
+
+
+def _backup_db(src_path, dest_gz, pages, pause):
+    with tempfile.TemporaryDirectory() as tmp:
+        copy = os.path.join(tmp, "copy.db")
+        metrics = online_copy(src_path, copy, pages, pause)
+        _compress(copy, dest_gz)
+    metrics.update(sha256=sha256_file(dest_gz), size=os.path.getsize(dest_gz))
+    return metrics
+
+
+def list_snapshots(backup_dir):
+    """Snapshot directories that have a manifest, oldest first."""
+    return sorted(
+        os.path.dirname(path) for path in glob.glob(os.path.join(backup_dir, "*", MANIFEST))
+    )
+
+
+def load_manifest(snapshot):
+    with open(os.path.join(snapshot, MANIFEST)) as f:
+        return json.load(f)
+
+
+def _tarball_sha256(backup_dir, stamp, tree):
+    """Recorded checksum of a snapshot's tarball for `tree`, whether or not the snapshot was pruned."""
+    for name in (MANIFEST, PHOTO_MANIFEST):
+        path = os.path.join(backup_dir, stamp, name)
+        if os.path.exists(path):
+            with open(path) as f:
+                return json.load(f).get(TREES[tree][1])
+    return None
+
+
+def _needed(manifest):
+    """(tree, stamp) of every tarball a snapshot's files live in."""
+    return {(tree, entry["snapshot"]) for tree in TREES for entry in manifest.get(tree, {}).values()}
+
+
+def _snapshot_tree(root, previous, stamp, snapshot, tree, skip_dirs=()):
+    """Record every file under root in the manifest, tarring only new or changed ones; returns (entries, added)."""
+    entries, changed = {}, []
+    if os.path.isdir(root):
+        for dirpath, dirs, files in os.walk(root):
+            dirs[:] = [d for d in dirs if d not in skip_dirs]
+            for name in files:
+                if name.endswith(".tmp"):  # still being written
+                    continue
+                path = os.path.join(dirpath, name)
+                rel = os.path.relpath(path, root)
+                digest = sha256_file(path)
+                if rel in previous and previous[rel]["sha256"] == digest:
+                    entries[rel] = previous[rel]
+                else:
+                    entries[rel] = {"sha256": digest, "snapshot": stamp}
+                    changed.append((path, rel))
+    if changed:
+        with tarfile.open(os.path.join(snapshot, TREES[tree][0]), "w:gz") as tar:
+            for path, rel in changed:
+                tar.add(path, arcname=rel)
+    return entries, len(changed)
+
+
+def create_snapshot(backup_dir, db_path, shard_dir=None, photo_dir="photos", archive_dir=None,
+                    pages=256, pause=0.005, keep=7):
+    """Back up the database(s), new photos and new archive files into a fresh snapshot, then prune old ones."""
+    previous = list_snapshots(backup_dir)
+    previous = load_manifest(previous[-1]) if previous else {}
+    stamp = datetime.datetime.now().strftime("%Y%m%dT%H%M%S%f")
+    snapshot = os.path.join(backup_dir, stamp)
+    os.makedirs(snapshot)
+    manifest = {"created": stamp, "databases": {}, "photos": {}}
+
+    manifest["databases"]["tracker.db"] = _backup_db(db_path, os.path.join(snapshot, "tracker.db.gz"), pages, pause)
+    if shard_dir and os.path.isdir(shard_dir):
+        os.makedirs(os.path.join(snapshot, "shards"))
+        for path in sorted(glob.glob(os.path.join(shard_dir, "user_*.db"))):
+            name = os.path.basename(path)
+            manifest["databases"][f"shards/{name}"] = _backup_db(
+                path, os.path.join(snapshot, "shards", name + ".gz"), pages, pause
+            )
+
+    # Files after databases: any archive run the database copy records wrote its Parquet files before committing
+    added = {}
+    for tree, root, skip_dirs in (("photos", photo_dir, SKIP_PHOTO_DIRS), ("archive", archive_dir, ())):
+        manifest[tree], added[tree] = {}, 0
+        if root:
+            manifest[tree], added[tree] = _snapshot_tree(root, previous.get(tree, {}), stamp, snapshot, tree, skip_dirs)
+        if added[tree]:
+            manifest[TREES[tree][1]] = sha256_file(os.path.join(snapshot, TREES[tree][0]))
+
+    dbs = manifest["databases"].values()
+    manifest["metrics"] = {
+        "max_step_ms": max(m["max_step_ms"] for m in dbs),
+        "locked_ms": sum(m["locked_ms"] for m in dbs),
+        "elapsed_ms": sum(m["elapsed_ms"] for m in dbs),
+        "photos_added": added["photos"],
+        "archive_files_added": added["archive"],
+    }
+    # Manifest last: a snapshot without one is incomplete and ignored
+    with open(os.path.join(snapshot, MANIFEST + ".tmp"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(os.path.join(snapshot, MANIFEST + ".tmp"), os.path.join(snapshot, MANIFEST))
+    prune(backup_dir, keep)
+    return snapshot, manifest
+
+
+def prune(backup_dir, keep):
+    """Drop all but the newest `keep` snapshots, keeping photo tarballs that kept snapshots still use."""
+    snapshots = list_snapshots(backup_dir)
+    kept, dropped = snapshots[-keep:], snapshots[:-keep]
+    needed = set().union(*(_needed(load_manifest(snapshot)) for snapshot in kept))
+    needed_stamps = {stamp for _, stamp in needed}
+    # Earlier prunes may have left tarball-only snapshots that nothing needs any more
+    for path in glob.glob(os.path.join(backup_dir, "*", PHOTO_MANIFEST)):
+        snapshot = os.path.dirname(path)
+        if os.path.basename(snapshot) not in needed_stamps:
+            shutil.rmtree(snapshot)
+    for snapshot in dropped:
+        stamp = os.path.basename(snapshot)
+        if stamp not in needed_stamps:
+            shutil.rmtree(snapshot)
+            continue
+        # Only tarballs are still referenced; keep those and the checksums
+        keep_names = {TREES[tree][0] for tree, needed_stamp in needed if needed_stamp == stamp} | {MANIFEST}
+        for name in os.listdir(snapshot):
+            if name not in keep_names:
+                path = os.path.join(snapshot, name)
+                shutil.rmtree(path) if os.path.isdir(path) else os.remove(path)
+        os.rename(os.path.join(snapshot, MANIFEST), os.path.join(snapshot, PHOTO_MANIFEST))
+
+
+def verify(backup_dir, snapshot):
+    """Return a list of problems (missing files, checksum mismatches) for a snapshot."""
+    manifest = load_manifest(snapshot)
+    problems = []
+    for name, info in manifest["databases"].items():
+        path = os.path.join(snapshot, name + ".gz")
+        if not os.path.exists(path) or sha256_file(path) != info["sha256"]:
+            problems.append(f"database {name} is missing or corrupt")
+    for tree, stamp in sorted(_needed(manifest)):
+        path = os.path.join(backup_dir, stamp, TREES[tree][0])
+        expected = _tarball_sha256(backup_dir, stamp, tree)
+        if not os.path.exists(path):
+            problems.append(f"{tree} tarball from {stamp} is missing")
+        elif expected is None or sha256_file(path) != expected:
+            problems.append(f"{tree} tarball from {stamp} is corrupt")
+    return problems
+
+
+def restore(backup_dir, snapshot, db_path, shard_dir=None, photo_dir="photos", archive_dir=None):
+    """Restore databases, photos and archive files from a snapshot. Stop the app first.
+
+    Everything is unpacked and checked beside its destination before the
+    first file is swapped in, so a bad snapshot leaves the current data as it was.
+    """
+    problems = verify(backup_dir, snapshot)
+    if problems:
+        raise ValueError("Snapshot failed verification: " + "; ".join(problems))
+    manifest = load_manifest(snapshot)
+
+    roots = {"photos": photo_dir, "archive": archive_dir}
+    if manifest.get("archive") and not archive_dir:
+        raise ValueError("Snapshot includes archived logs; pass the archive directory to restore them")
+    staging, targets = {}, []
+    try:
+        # Stage each tree beside its destination so the final moves are renames
+        for tree in TREES:
+            entries = manifest.get(tree, {})
+            if not entries:
+                continue
+            os.makedirs(roots[tree], exist_ok=True)
+            staging[tree] = tempfile.mkdtemp(prefix=".restore-", dir=os.path.dirname(os.path.abspath(roots[tree])))
+            by_snapshot = {}
+            for rel, entry in entries.items():
+                by_snapshot.setdefault(entry["snapshot"], set()).add(rel)
+            for stamp, names in by_snapshot.items():
+                with tarfile.open(os.path.join(backup_dir, stamp, TREES[tree][0]), "r:gz") as tar:
+                    members = [m for m in tar.getmembers() if m.name in names]
+                    tar.extractall(staging[tree], members=members, filter="data")
+            for rel, entry in entries.items():
+                path = os.path.join(staging[tree], rel)
+                if not os.path.exists(path) or sha256_file(path) != entry["sha256"]:
+                    raise ValueError(f"Snapshot failed verification: {tree} file {rel} is missing or corrupt")
+
+        for name in manifest["databases"]:
+            target = db_path if name == "tracker.db" else os.path.join(shard_dir, os.path.basename(name))
+            os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+            targets.append(target)
+            with gzip.open(os.path.join(snapshot, name + ".gz"), "rb") as f, open(target + ".restore", "wb") as out:
+                shutil.copyfileobj(f, out)
+
+        for target in targets:
+            for suffix in ("-wal", "-shm"):  # stale WAL frames would be replayed over the restored file
+                if os.path.exists(target + suffix):
+                    os.remove(target + suffix)
+            os.replace(target + ".restore", target)
+        for tree, path in staging.items():
+            for rel in manifest[tree]:
+                os.makedirs(os.path.dirname(os.path.join(roots[tree], rel)), exist_ok=True)
+                os.replace(os.path.join(path, rel), os.path.join(roots[tree], rel))
+    finally:
+        for path in staging.values():
+            shutil.rmtree(path, ignore_errors=True)
+        for target in targets:
+            if os.path.exists(target + ".restore"):
+                os.remove(target + ".restore")
+    return manifest
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Back up or restore the tracker database, photos and archived logs.")
+    parser.add_argument("command", choices=["backup", "restore", "list"])
+    parser.add_argument("snapshot", nargs="?", help="snapshot to restore (default: newest)")
+    parser.add_argument("--backup-dir", default="/tmp/tracker_backups")
+    parser.add_argument("--db", default="/tmp/tracker.db")
+    parser.add_argument("--shard-dir", default="/tmp/tracker_shards")
+    parser.add_argument("--photo-dir", default="photos")
+    parser.add_argument("--archive-dir", default="/tmp/tracker_archive")
+    parser.add_argument("--keep", type=int, default=7)
+    args = parser.parse_args()
+
+    if args.command == "backup":
+        snapshot, manifest = create_snapshot(args.backup_dir, args.db, args.shard_dir, args.photo_dir, args.archive_dir,
+                                             keep=args.keep)
+        m = manifest["metrics"]
+        print(f"{snapshot}: longest lock {m['max_step_ms']:.1f} ms, "
+              f"{m['locked_ms']:.1f} ms locked of {m['elapsed_ms']:.1f} ms, {m['photos_added']} photos and "
+              f"{m['archive_files_added']} archive files added")
+    elif args.command == "list":
+        for snapshot in list_snapshots(args.backup_dir):
+            m = load_manifest(snapshot)["metrics"]
+            print(f"{os.path.basename(snapshot)}  longest lock {m['max_step_ms']:.1f} ms  photos added {m['photos_added']}")
+    else:
+        snapshots = list_snapshots(args.backup_dir)
+        if not snapshots:
+            parser.error("no snapshots found")
+        snapshot = os.path.join(args.backup_dir, args.snapshot) if args.snapshot else snapshots[-1]
+        restore(args.backup_dir, snapshot, args.db, args.shard_dir, args.photo_dir, args.archive_dir)
+        print(f"Restored {snapshot}")
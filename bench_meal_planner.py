@@ -0,0 +1,49 @@
+"""Meal planner latency, memory and plan quality across catalogue sizes and plan sizes.
+
+Run with `python bench_meal_planner.py`.
+"""
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+
+from meal_planner import plan_meals
+
+
+def random_catalogue(n, rng):
+    protein = rng.gamma(2.0, 6.0, n)
+    carbs = rng.gamma(1.5, 12.0, n)
+    fats = rng.gamma(1.2, 5.0, n)
+    calories = 4 * protein + 4 * carbs + 9 * fats
+    return {
+        f"Food {i}": {"Calories": calories[i], "Protein": protein[i], "Carbs": carbs[i], "Fats": fats[i]}
+        for i in range(n)
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 5000, 20000])
+    parser.add_argument("--foods-per-plan", type=int, nargs="+", default=[2, 3, 4, 5, 6])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    targets = {"Calories": 2500, "Protein": 180, "Carbs": 250, "Fats": 80}
+    print(f"{'foods':>7} {'k':>3} {'best ms':>8} {'median ms':>10} {'peak MB':>8} {'best plan error':>16}")
+    for size in args.sizes:
+        foods = random_catalogue(size, rng)
+        for k in args.foods_per_plan:
+            timings = []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                plans = plan_meals(foods, targets, foods_per_plan=k)
+                timings.append((time.perf_counter() - started) * 1000)
+            # Separate traced run: tracemalloc slows numpy allocations down
+            tracemalloc.start()
+            plan_meals(foods, targets, foods_per_plan=k)
+            peak = tracemalloc.get_traced_memory()[1] / 1e6
+            tracemalloc.stop()
+            print(f"{size:>7} {k:>3} {min(timings):>8.1f} {np.median(timings):>10.1f} {peak:>8.1f} "
+                  f"{plans[0]['error']:>16.4f}")
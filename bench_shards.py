@@ -0,0 +1,113 @@
+"""Mixed multi-user throughput: single-file database vs per-user shards.
+
+Each simulated user inserts workouts and periodically runs the weekly volume
+aggregate the Workouts page issues. Run with `python bench_shards.py`.
+"""
+import argparse
+import datetime
+import random
+import tempfile
+import threading
+import time
+
+from sqlalchemy import Column, Date, Float, Integer, MetaData, String, Table, create_engine, event, func, select
+
+from shards import ShardRouter
+
+metadata = MetaData()
+workouts = Table(
+    "workouts", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("user_id", Integer),
+    Column("exercise", String),
+    Column("sets", Integer),
+    Column("reps", Integer),
+    Column("weight", Float),
+    Column("date", Date),
+)
+
+
+def make_engine(path):
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False, "timeout": 30})
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_conn, _):
+        cursor = dbapi_conn.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.close()
+
+    return engine
+
+
+def seed(engine_for, users, history):
+    start = datetime.date.today() - datetime.timedelta(days=history)
+    for user_id in range(1, users + 1):
+        rows = [
+            {"user_id": user_id, "exercise": f"Exercise {i % 20}", "sets": 3, "reps": 10,
+             "weight": 50.0 + i % 40, "date": start + datetime.timedelta(days=i % history)}
+            for i in range(history * 4)
+        ]
+        with engine_for(user_id).begin() as conn:
+            conn.execute(workouts.insert(), rows)
+
+
+def run_user(engine_for, user_id, ops, read_every, counts):
+    rng = random.Random(user_id)
+    engine = engine_for(user_id)
+    weekly = (
+        select(workouts.c.exercise, func.strftime("%Y-%W", workouts.c.date),
+               func.sum(workouts.c.sets * workouts.c.reps * workouts.c.weight))
+        .where(workouts.c.user_id == user_id)
+        .group_by(workouts.c.exercise, func.strftime("%Y-%W", workouts.c.date))
+    )
+    for i in range(ops):
+        if i % read_every == 0:
+            with engine.connect() as conn:
+                conn.execute(weekly).fetchall()
+        else:
+            with engine.begin() as conn:
+                conn.execute(workouts.insert(), {
+                    "user_id": user_id, "exercise": f"Exercise {rng.randrange(20)}", "sets": 3,
+                    "reps": 10, "weight": rng.uniform(20, 140), "date": datetime.date.today(),
+                })
+        counts[user_id] += 1
+
+
+def bench(mode, users, ops, read_every, history):
+    with tempfile.TemporaryDirectory() as tmp:
+        if mode == "single":
+            engine = make_engine(f"{tmp}/tracker.db")
+            metadata.create_all(engine)
+            engine_for = lambda user_id: engine
+        else:
+            router = ShardRouter(f"{tmp}/shards", metadata.sorted_tables, engine_factory=make_engine)
+            engine_for = router.engine_for
+        seed(engine_for, users, history)
+
+        counts = {user_id: 0 for user_id in range(1, users + 1)}
+        threads = [
+            threading.Thread(target=run_user, args=(engine_for, user_id, ops, read_every, counts))
+            for user_id in counts
+        ]
+        started = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - started
+        return sum(counts.values()) / elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--ops", type=int, default=200, help="operations per user")
+    parser.add_argument("--read-every", type=int, default=5, help="one aggregate read per N operations")
+    parser.add_argument("--history", type=int, default=365, help="days of seeded history per user")
+    args = parser.parse_args()
+
+    print(f"{'users':>6} {'single ops/s':>14} {'sharded ops/s':>14} {'speedup':>8}")
+    for users in args.users:
+        single = bench("single", users, args.ops, args.read_every, args.history)
+        sharded = bench("sharded", users, args.ops, args.read_every, args.history)
+        print(f"{users:>6} {single:>14.0f} {sharded:>14.0f} {sharded / single:>7.2f}x")
@@ -0,0 +1,159 @@
+import datetime
+import threading
+
+import pandas as pd
+from sqlalchemy import MetaData, and_, func, select, text, union_all
+
+# ----------------------
+# CALENDAR DIMENSION
+# ----------------------
+# One row per day with its ISO year-week, month and training block, so charts
+# bucket log rows with an indexed join in SQL instead of parsing every date
+# in pandas on each rerun. Keys carry the year ("2024-W05"), so the same week
+# number from different years never lands in one bar.
+
+# Chart label -> calendar column ("phase" is resolved per day from the user's training cycles)
+BUCKETS = {
+    "Week": "year_week",
+    "Month": "month",
+    "Training Block": "training_block",
+    "Cycle Phase": "phase",
+}
+BLOCK_WEEKS = 4  # training block = consecutive 4-week mesocycle within the ISO year
+CALENDAR_START = datetime.date(2000, 1, 1)
+
+_prepared = set()
+_lock = threading.Lock()
+
+
+def calendar_rows(start, end):
+    days = pd.date_range(start, end, freq="D")
+    iso = days.isocalendar()
+    year = iso["year"].astype(str)
+    week = iso["week"].astype(int)
+    frame = pd.DataFrame({
+        "date": days.date,
+        "iso_year": iso["year"].astype(int).values,
+        "iso_week": week.values,
+        "year_week": (year + "-W" + week.astype(str).str.zfill(2)).values,
+        "month": days.strftime("%Y-%m"),
+        "training_block": (year + "-B" + ((week - 1) // BLOCK_WEEKS + 1).astype(str).str.zfill(2)).values,
+    })
+    return frame.to_dict("records")
+
+
+def cover_dates(conn, calendar, start, end):
+    """Add whatever calendar days are missing for [start, end] to the calendar."""
+    first, last = conn.execute(select(func.min(calendar.c.date), func.max(calendar.c.date))).one()
+    insert = calendar.insert().prefix_with("OR IGNORE")  # another process may be filling the same days
+    if first is None:
+        conn.execute(insert, calendar_rows(start, end))
+        return
+    if start < first:
+        conn.execute(insert, calendar_rows(start, first - datetime.timedelta(days=1)))
+    if end > last:
+        conn.execute(insert, calendar_rows(last + datetime.timedelta(days=1), end))
+
+
+def ensure_calendar(engine, calendar, log_tables=(), end=None):
+    """Fill the calendar through `end` (default: two years out) and every logged date, and index log dates.
+
+    Cheap to call on every rerun: each engine is only checked once per process.
+    Dates logged later outside the range are covered by bucketed_totals.
+    """
+    end = end or datetime.date.today() + datetime.timedelta(days=730)
+    key = (str(engine.url), end.year)
+    with _lock:
+        if key in _prepared:
+            return
+        with engine.begin() as conn:
+            start = CALENDAR_START
+            for table in log_tables:
+                first, last = conn.execute(select(func.min(table.c.date), func.max(table.c.date))).one()
+                start, end = min(start, first or start), max(end, last or end)
+            cover_dates(conn, calendar, start, end)
+            for table in log_tables:
+                conn.execute(text(
+                    f"CREATE INDEX IF NOT EXISTS ix_{table.name}_user_date ON {table.name} (user_id, date)"
+                ))
+        _prepared.add(key)
+
+
+def daily_phases(calendar, cycles, user_id):
+    """The user's phase for each calendar day; where cycles overlap, the latest-starting one wins."""
+    ranked = (
+        select(
+            calendar.c.date,
+            cycles.c.phase,
+            func.row_number().over(
+                partition_by=calendar.c.date, order_by=(cycles.c.start_date.desc(), cycles.c.id.desc())
+            ).label("rank"),
+        )
+        .join_from(calendar, cycles, and_(
+            cycles.c.user_id == user_id,
+            calendar.c.date >= cycles.c.start_date,
+            calendar.c.date <= cycles.c.end_date,
+        ))
+        .subquery()
+    )
+    return select(ranked.c.date, ranked.c.phase).where(ranked.c.rank == 1).subquery("phases")
+
+
+def bucketed_totals(engine, log_table, calendar, user_id, measures, by=(), bucket="year_week", cycles=None,
+                    start=None, end=None, archived=None):
+    """Sum `measures` per calendar bucket and `by` columns.
+
+    `measures` maps a name to a function building the expression from the
+    row columns, e.g. {"volume": lambda c: c.sets * c.reps * c.weight}, so it
+    works whether rows come from the log table alone or a union with archived
+    rows. Rows from `archived` (a DataFrame of archived log rows) are loaded
+    into a temp table and unioned in, so they bucket through the same join.
+    Returns a DataFrame with a "bucket" column, the `by` columns and one column per measure.
+    """
+    # Every row must find its calendar day, or the join would silently drop it
+    with engine.connect() as conn:
+        first, last = conn.execute(
+            select(func.min(log_table.c.date), func.max(log_table.c.date)).where(log_table.c.user_id == user_id)
+        ).one()
+        days = conn.execute(select(func.min(calendar.c.date), func.max(calendar.c.date))).one()
+    if archived is not None and not archived.empty:
+        first = min(d for d in (first, archived["date"].min()) if d is not None)
+        last = max(d for d in (last, archived["date"].max()) if d is not None)
+    if first is not None and (days[0] is None or first < days[0] or last > days[1]):
+        with _lock, engine.begin() as conn:
+            cover_dates(conn, calendar, first, last)
+
+    with engine.connect() as conn:
+        rows = log_table
+        if archived is not None and not archived.empty:
+            temp = log_table.to_metadata(MetaData(), name=f"archived_{log_table.name}")
+            conn.execute(text(f"DROP TABLE IF EXISTS temp.{temp.name}"))
+            conn.execute(text(f"CREATE TEMP TABLE {temp.name} AS SELECT * FROM {log_table.name} WHERE 0"))
+            conn.execute(temp.insert(), archived[[c.name for c in log_table.columns]].to_dict("records"))
+            rows = union_all(select(log_table), select(temp)).subquery("rows")
+
+        if bucket == "phase":
+            phases = daily_phases(calendar, cycles, user_id)
+            bucket_col = func.coalesce(phases.c.phase, "Unassigned")
+            source = rows.outerjoin(phases, phases.c.date == rows.c.date)
+        else:
+            bucket_col = calendar.c[bucket]
+            source = rows.join(calendar, calendar.c.date == rows.c.date)
+        conditions = [rows.c.user_id == user_id]
+        if start is not None:
+            conditions.append(rows.c.date >= start)
+        if end is not None:
+            conditions.append(rows.c.date <= end)
+        group_cols = [bucket_col.label("bucket")] + [rows.c[col] for col in by]
+        query = (
+            select(*group_cols, *[func.sum(measure(rows.c)).label(name) for name, measure in measures.items()])
+            .select_from(source)
+            .where(*conditions)
+            .group_by(*group_cols)
+            .order_by(func.min(rows.c.date))
+        )
+        result = pd.DataFrame(conn.execute(query).mappings().all(), columns=["bucket", *by, *measures])
+        if rows is not log_table:
+            conn.execute(text(f"DROP TABLE temp.{temp.name}"))
+            conn.commit()
+        return result
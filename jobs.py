@@ -0,0 +1,208 @@
+import datetime
+import json
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import delete, func, select, update
+
+# ----------------------
+# BACKGROUND JOBS
+# ----------------------
+# Heavy work (archiving, thumbnails, backups, ...) is recorded in the jobs
+# table and run by a small in-process worker pool, so Streamlit reruns only
+# ever pay for an INSERT. Hints fired on every save go through defer()
+# instead, which coalesces them in memory and leaves the INSERT to the
+# dispatcher thread. Jobs survive restarts because the queue is the table
+# itself; anything left "running" by a dead process is requeued on startup.
+# Finished jobs are purged once they are older than the retention period.
+#
+# Only one queued job is kept per (user_id, job_type): enqueueing again just
+# raises its priority or brings it forward. Handlers should therefore work out what needs doing
+# from the database rather than from the payload alone.
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+PURGE_EVERY = datetime.timedelta(hours=1)
+
+
+def utcnow():
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+
+class JobScheduler:
+    """Persistent priority job queue with retries, run by a worker thread pool."""
+
+    def __init__(self, engine, jobs, workers=2, poll_interval=2.0, retry_delay=5.0, retention_days=7):
+        self.engine = engine
+        self.jobs = jobs
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.retry_delay = retry_delay  # seconds, doubled on every further attempt
+        self.retention = datetime.timedelta(days=retention_days)  # how long done/failed jobs are kept
+        self._handlers = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._running = 0
+        self._deferred = {}  # (user_id, job_type) -> (payload, priority, run_after)
+        self._deferred_lock = threading.Lock()
+        self._last_purge = None
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tracker-job")
+        with engine.begin() as conn:
+            conn.execute(update(jobs).where(jobs.c.status == RUNNING).values(status=QUEUED, updated_at=utcnow()))
+        self._thread = threading.Thread(target=self._dispatch, name="tracker-jobs", daemon=True)
+        self._thread.start()
+
+    def register(self, job_type, handler, max_attempts=3):
+        """handler(user_id, payload) runs on a worker thread; raising triggers a retry."""
+        self._handlers[job_type] = (handler, max_attempts)
+
+    def enqueue(self, user_id, job_type, payload=None, priority=0, delay=0):
+        """Queue a job (higher priority runs first) and return its id; deduped per user and type.
+
+        Enqueueing over an already queued job keeps the higher priority and the earlier start.
+        """
+        return self._enqueue(user_id, job_type, payload, priority, utcnow() + datetime.timedelta(seconds=delay))
+
+    def defer(self, user_id, job_type, payload=None, priority=0, delay=0):
+        """Like enqueue(), but only noted in memory; the dispatcher writes it out on its next pass.
+
+        Meant for hints fired on every save: repeated calls coalesce without
+        touching the database on the caller's thread. A hint not yet written
+        out is lost if the process dies; the next save raises it again.
+        """
+        self._merge_deferred(user_id, job_type, payload, priority, utcnow() + datetime.timedelta(seconds=delay))
+
+    def _merge_deferred(self, user_id, job_type, payload, priority, run_after):
+        with self._deferred_lock:
+            pending = self._deferred.get((user_id, job_type))
+            if pending:
+                priority, run_after = max(priority, pending[1]), min(run_after, pending[2])
+            self._deferred[user_id, job_type] = (payload, priority, run_after)
+
+    def _enqueue(self, user_id, job_type, payload, priority, run_after):
+        now = utcnow()
+        with self._lock, self.engine.begin() as conn:
+            existing = conn.execute(
+                select(self.jobs.c.id, self.jobs.c.priority, self.jobs.c.run_after).where(
+                    self.jobs.c.user_id.is_(None) if user_id is None else self.jobs.c.user_id == user_id,
+                    self.jobs.c.job_type == job_type,
+                    self.jobs.c.status == QUEUED,
+                )
+            ).first()
+            if existing:
+                if priority > existing.priority or run_after < existing.run_after:
+                    conn.execute(update(self.jobs).where(self.jobs.c.id == existing.id).values(
+                        priority=max(priority, existing.priority),
+                        run_after=min(run_after, existing.run_after),
+                    ))
+                    self._wake.set()
+                return existing.id
+            job_id = conn.execute(self.jobs.insert().values(
+                user_id=user_id, job_type=job_type, priority=priority, status=QUEUED,
+                attempts=0, max_attempts=self._handlers.get(job_type, (None, 3))[1],
+                payload=json.dumps(payload or {}), run_after=run_after,
+                created_at=now, updated_at=now,
+            )).inserted_primary_key[0]
+        self._wake.set()
+        return job_id
+
+    def purge(self):
+        """Delete done and failed jobs last updated before the retention period; returns rows removed."""
+        cutoff = utcnow() - self.retention
+        with self.engine.begin() as conn:
+            return conn.execute(
+                delete(self.jobs).where(self.jobs.c.status.in_((DONE, FAILED)), self.jobs.c.updated_at < cutoff)
+            ).rowcount
+
+    def status_counts(self, user_id=None):
+        query = select(self.jobs.c.status, func.count()).group_by(self.jobs.c.status)
+        if user_id is not None:
+            query = query.where(self.jobs.c.user_id == user_id)
+        with self.engine.connect() as conn:
+            return dict(conn.execute(query).all())
+
+    def recent(self, user_id=None, limit=10):
+        query = select(self.jobs).order_by(self.jobs.c.updated_at.desc()).limit(limit)
+        if user_id is not None:
+            query = query.where(self.jobs.c.user_id == user_id)
+        with self.engine.connect() as conn:
+            return [dict(row) for row in conn.execute(query).mappings()]
+
+    # ----------------------
+    # Dispatcher
+    # ----------------------
+    def _dispatch(self):
+        while True:
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            try:
+                self._flush_deferred()
+                if self._last_purge is None or utcnow() - self._last_purge > PURGE_EVERY:
+                    self.purge()
+                    self._last_purge = utcnow()
+                for job in self._claim():
+                    self._pool.submit(self._run, job)
+            except Exception:
+                traceback.print_exc()
+
+    def _flush_deferred(self):
+        with self._deferred_lock:
+            pending, self._deferred = self._deferred, {}
+        while pending:
+            (user_id, job_type), (payload, priority, run_after) = next(iter(pending.items()))
+            try:
+                self._enqueue(user_id, job_type, payload, priority, run_after)
+            except Exception:
+                # Put back whatever wasn't written so the next pass retries it
+                for key, value in pending.items():
+                    self._merge_deferred(*key, *value)
+                raise
+            del pending[user_id, job_type]
+
+    def _claim(self):
+        with self._lock:
+            free = self.workers - self._running
+            if free <= 0:
+                return []
+            claimed = []
+            with self.engine.begin() as conn:
+                candidates = conn.execute(
+                    select(self.jobs)
+                    .where(self.jobs.c.status == QUEUED, self.jobs.c.run_after <= utcnow())
+                    .order_by(self.jobs.c.priority.desc(), self.jobs.c.id)
+                    .limit(free)
+                ).mappings().all()
+                for job in candidates:
+                    taken = conn.execute(
+                        update(self.jobs)
+                        .where(self.jobs.c.id == job["id"], self.jobs.c.status == QUEUED)
+                        .values(status=RUNNING, attempts=self.jobs.c.attempts + 1, updated_at=utcnow())
+                    ).rowcount
+                    if taken:
+                        claimed.append(dict(job, attempts=job["attempts"] + 1))
+            self._running += len(claimed)
+            return claimed
+
+    def _run(self, job):
+        handler, _ = self._handlers.get(job["job_type"], (None, 0))
+        try:
+            if handler is None:
+                raise LookupError(f"No handler registered for job type {job['job_type']!r}")
+            handler(job["user_id"], json.loads(job["payload"] or "{}"))
+            values = {"status": DONE, "error": None}
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            if handler is not None and job["attempts"] < job["max_attempts"]:
+                delay = self.retry_delay * 2 ** (job["attempts"] - 1)
+                values = {"status": QUEUED, "error": error,
+                          "run_after": utcnow() + datetime.timedelta(seconds=delay)}
+            else:
+                values = {"status": FAILED, "error": error}
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(update(self.jobs).where(self.jobs.c.id == job["id"]).values(updated_at=utcnow(), **values))
+        finally:
+            # Free the slot even if the status write fails; the row is requeued on the next startup
+            with self._lock:
+                self._running -= 1
+            self._wake.set()
@@ -0,0 +1,110 @@
+import pandas as pd
+from sqlalchemy import bindparam, delete, select, tuple_, update
+
+# ----------------------
+# LOG BROWSER
+# ----------------------
+# Pages are fetched newest first with keyset pagination on (date, id), so
+# page 500 costs the same index seek as page 1 instead of an OFFSET scan.
+# Edits from one grid are written back in a single transaction.
+
+PAGE_SIZE = 50
+
+# Table -> column offered as the server-side value filter
+FILTER_COLUMNS = {
+    "doses": "compound",
+    "meals": "meal",
+    "workouts": "exercise",
+    "bloodwork": "test",
+}
+
+
+def _filtered(table, user_id, start=None, end=None, values=None):
+    conditions = [table.c.user_id == user_id]
+    if start is not None:
+        conditions.append(table.c.date >= start)
+    if end is not None:
+        conditions.append(table.c.date <= end)
+    filter_col = FILTER_COLUMNS.get(table.name)
+    if values and filter_col:
+        conditions.append(table.c[filter_col].in_(values))
+    return conditions
+
+
+def filter_values(engine, table, user_id):
+    col = table.c[FILTER_COLUMNS[table.name]]
+    with engine.connect() as conn:
+        return [v for v in conn.execute(
+            select(col).where(table.c.user_id == user_id).distinct().order_by(col)
+        ).scalars() if v is not None]
+
+
+def fetch_page(engine, table, user_id, after=None, start=None, end=None, values=None, limit=PAGE_SIZE):
+    """Return (rows, next_cursor) for the page after `after`, a (date, id) cursor.
+
+    next_cursor is None on the last page.
+    """
+    conditions = _filtered(table, user_id, start, end, values)
+    if after is not None:
+        conditions.append(tuple_(table.c.date, table.c.id) < tuple_(*after))
+    query = (
+        select(table).where(*conditions)
+        .order_by(table.c.date.desc(), table.c.id.desc())
+        .limit(limit + 1)
+    )
+    with engine.connect() as conn:
+        rows = conn.execute(query).mappings().all()
+    page = pd.DataFrame(rows[:limit], columns=[c.name for c in table.columns])
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = (last["date"], last["id"])
+    return page, next_cursor
+
+
+def diff_pages(original, edited, key="id", delete_col="delete"):
+    """Compare the fetched page with the edited grid: (updates, delete_ids)."""
+    deletes = [int(i) for i in edited.loc[edited[delete_col].fillna(False).astype(bool), key]]
+    kept = edited[~edited[key].isin(deletes)].drop(columns=[delete_col]).set_index(key)
+    base = original.set_index(key).loc[kept.index, kept.columns]
+    if "date" in kept.columns:
+        # The grid may hand dates back as Timestamps
+        kept = kept.assign(date=pd.to_datetime(kept["date"]).dt.date)
+        base = base.assign(date=pd.to_datetime(base["date"]).dt.date)
+    changed = ~((kept == base) | (kept.isna() & base.isna())).all(axis=1)
+    updates = [
+        {key: int(row_id), **{col: _plain(v) for col, v in row.items()}}
+        for row_id, row in kept[changed].iterrows()
+    ]
+    return updates, deletes
+
+
+def _plain(value):
+    # numpy scalars from the grid -> Python values sqlite3 can bind
+    if pd.isna(value):
+        return None
+    return value.item() if hasattr(value, "item") else value
+
+
+def apply_changes(engine, table, user_id, updates, deletes):
+    """Apply grid edits as one transaction; rows are always scoped to user_id.
+
+    Returns (rows updated, rows deleted) as counted by the database.
+    """
+    updated = deleted = 0
+    if not updates and not deletes:
+        return updated, deleted
+    with engine.begin() as conn:
+        if updates:
+            cols = [c for c in updates[0] if c != "id"]
+            stmt = (
+                update(table)
+                .where(table.c.id == bindparam("row_id"), table.c.user_id == user_id)
+                .values({c: bindparam(f"v_{c}") for c in cols})
+            )
+            updated = conn.execute(stmt, [
+                {"row_id": row["id"], **{f"v_{c}": row[c] for c in cols}} for row in updates
+            ]).rowcount
+        if deletes:
+            deleted = conn.execute(delete(table).where(table.c.id.in_(deletes), table.c.user_id == user_id)).rowcount
+    return updated, deleted
@@ -0,0 +1,104 @@
+import itertools
+import math
+
+import numpy as np
+
+# ----------------------
+# MACRO-TARGET MEAL PLANNER
+# ----------------------
+# Picks a handful of foods and whole-number servings whose totals land as
+# close as possible to the day's calorie/protein/carb/fat targets.
+#
+# Trying every subset of a big catalogue is hopeless, so we first shortlist a
+# pool of foods that point in useful directions (balanced overall, or dense
+# in one macro), then solve the least-squares problem for every k-food
+# combination of the pool at once with batched numpy linear algebra, and
+# finally round each solution to integer servings by checking every
+# floor/ceil corner. The pool shrinks as plans get bigger so the number of
+# candidates (combinations x corners) stays bounded.
+
+MACROS = ("Calories", "Protein", "Carbs", "Fats")
+# Cap on combinations x rounding corners per request; C(28, 4) * 2^4 stays well under a second
+MAX_CANDIDATES = 350_000
+
+
+def _shortlist(F, pool_size, macros=MACROS):
+    """Indices of foods worth combining; F is the target-normalised macro matrix with `macros` columns."""
+    n = len(F)
+    if n <= pool_size:
+        return np.arange(n)
+    norms = np.linalg.norm(F, axis=1) + 1e-9
+    balanced = F.sum(axis=1) / (norms * np.sqrt(F.shape[1]))   # cosine with the target
+    share = F / (F.sum(axis=1, keepdims=True) + 1e-9)          # how macro-dense each food is
+    per = max(1, pool_size // (F.shape[1] + 1))
+    picks = [np.argpartition(-balanced, per)[:per]]
+    for m, macro in enumerate(macros):
+        if macro == "Calories":  # the sum of the others, not a direction of its own
+            continue
+        picks.append(np.argpartition(-share[:, m], per)[:per])
+    pool = np.unique(np.concatenate(picks))
+    if len(pool) < pool_size:
+        ranked = np.argsort(-balanced)
+        rest = ranked[np.isin(ranked, pool, invert=True)][:pool_size - len(pool)]
+        pool = np.concatenate([pool, rest])
+    return pool
+
+
+def _pool_size(pool_size, k):
+    """Largest pool (up to pool_size) whose k-food combinations fit in MAX_CANDIDATES."""
+    while pool_size > k and math.comb(pool_size, k) * 2 ** k > MAX_CANDIDATES:
+        pool_size -= 1
+    return pool_size
+
+
+def plan_meals(foods, targets, n_plans=5, foods_per_plan=4, pool_size=28, max_servings=8, weights=None):
+    """Return up to n_plans ranked plans for {name: {macro: value}} foods.
+
+    Each plan is {"servings": {name: int}, "totals": {macro: float}, "error": float},
+    where error is the weighted squared relative miss across the macros.
+    """
+    if not any(float(targets[m] or 0) > 0 for m in MACROS):
+        raise ValueError("At least one macro target must be above zero")
+    names = list(foods)
+    if not names:
+        return []
+    A = np.array([[float(foods[name].get(m) or 0.0) for m in MACROS] for name in names])
+    t = np.array([float(targets[m]) for m in MACROS])
+    w = np.ones(len(MACROS)) if weights is None else np.array([weights.get(m, 1.0) for m in MACROS])
+    active = t > 0
+    A, t, w = A[:, active], t[active], w[active]
+    F = A / t  # 1.0 in every column means "hits the target exactly"
+
+    pool = _shortlist(F, _pool_size(pool_size, foods_per_plan), [m for m, on in zip(MACROS, active) if on])
+    k = min(foods_per_plan, len(pool))
+    combos = pool[np.array(list(itertools.combinations(range(len(pool)), k)))]  # (c, k)
+    M = F[combos] * np.sqrt(w)                                                   # (c, k, macros)
+    rhs = np.sqrt(w)
+
+    # Batched normal equations (M M^T) x = M rhs, with a touch of ridge for collinear foods
+    gram = M @ M.transpose(0, 2, 1) + 1e-6 * np.eye(k)
+    x = np.linalg.solve(gram, (M @ rhs)[..., None])[..., 0]
+    x = np.clip(x, 0, max_servings)
+
+    # Integer servings: score all 2^k floor/ceil corners around each solution
+    corners = np.array(list(itertools.product((0, 1), repeat=k)))              # (2^k, k)
+    servings = np.clip(np.floor(x)[:, None, :] + corners[None], 0, max_servings)  # (c, 2^k, k)
+    totals = np.einsum("cjk,ckm->cjm", servings, M)
+    error = ((totals - rhs) ** 2).sum(axis=2)
+    error[servings.sum(axis=2) == 0] = np.inf
+    best = error.argmin(axis=1)
+    servings = servings[np.arange(len(combos)), best]
+    error = error[np.arange(len(combos)), best]
+
+    plans, seen = [], set()
+    for c in np.argsort(error):
+        if not np.isfinite(error[c]) or len(plans) >= n_plans:
+            break
+        chosen = {names[i]: int(s) for i, s in zip(combos[c], servings[c]) if s > 0}
+        signature = frozenset(chosen.items())
+        if signature in seen:
+            continue
+        seen.add(signature)
+        total = {m: float(sum((foods[n].get(m) or 0.0) * s for n, s in chosen.items())) for m in MACROS}
+        plans.append({"servings": chosen, "totals": total, "error": float(error[c])})
+    return plans
@@ -0,0 +1,147 @@
+import argparse
+import os
+import threading
+from collections import defaultdict
+
+from sqlalchemy import MetaData, create_engine, select, tuple_
+from sqlalchemy.orm import Session
+
+# ----------------------
+# PER-USER SHARDS
+# ----------------------
+# In sharded mode every user's log rows live in their own SQLite file, so one
+# heavy user only ever locks (and grows) their own shard. Users, exercises and
+# routines stay in the shared catalogue database.
+
+# Per-user tables: everything keyed by user_id lives in that user's shard
+LOG_TABLES = (
+    "doses", "meals", "workouts", "bloodwork", "photos", "food_items",
+    "training_cycles", "archive_watermarks", "archive_rollups", "archive_runs",
+)
+# Small shared dimensions copied into every shard so chart joins stay local
+DIMENSION_TABLES = ("calendar",)
+
+
+def default_engine_factory(path):
+    return create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+
+
+class ShardRouter:
+    """Maps a user_id to the SQLite shard holding that user's log tables."""
+
+    def __init__(self, shard_dir, tables, catalogue_engine=None, engine_factory=default_engine_factory):
+        self.shard_dir = shard_dir
+        self.tables = [t for t in tables if t.name in LOG_TABLES + DIMENSION_TABLES]
+        self.catalogue_engine = catalogue_engine
+        self.engine_factory = engine_factory
+        self._engines = {}
+        self._lock = threading.Lock()
+        os.makedirs(shard_dir, exist_ok=True)
+
+    def shard_path(self, user_id):
+        return os.path.join(self.shard_dir, f"user_{int(user_id)}.db")
+
+    def engine_for(self, user_id):
+        with self._lock:
+            engine = self._engines.get(user_id)
+            if engine is None:
+                engine = self.engine_factory(self.shard_path(user_id))
+                self.tables[0].metadata.create_all(engine, tables=self.tables)
+                self._engines[user_id] = engine
+            return engine
+
+    def session_for(self, user_id, **kwargs):
+        """ORM session with log tables bound to the user's shard, everything else to the catalogue."""
+        shard = self.engine_for(user_id)
+        return Session(bind=self.catalogue_engine, binds={t: shard for t in self.tables}, **kwargs)
+
+    def shard_paths(self):
+        return sorted(
+            os.path.join(self.shard_dir, name)
+            for name in os.listdir(self.shard_dir)
+            if name.startswith("user_") and name.endswith(".db")
+        )
+
+
+# ----------------------
+# MIGRATION FROM SINGLE FILE
+# ----------------------
+class MigrationConflict(Exception):
+    """Raised when a shard already holds a different row under a migrated row's key."""
+
+
+def migrate_single_file(source_path, shard_dir, batch_size=1000, drop_source=False, log=print):
+    """Copy every log row from the single-file database into per-user shards.
+
+    Row ids are preserved. Rows already in the shard unchanged are skipped, so
+    the migration can be re-run after an interruption; a shard row that differs
+    under the same key (the app already ran sharded) raises MigrationConflict
+    rather than losing either row. With drop_source, only rows now present in
+    a shard are deleted from the source; rows without a user_id are left alone.
+    """
+    source = default_engine_factory(source_path)
+    metadata = MetaData()
+    metadata.reflect(source, only=lambda name, _: name in LOG_TABLES)
+    router = ShardRouter(shard_dir, list(metadata.tables.values()))
+
+    totals = {}
+    for table in router.tables:
+        if table.name not in LOG_TABLES:
+            continue
+        pending = defaultdict(list)
+        migrated = []  # primary keys now safely in a shard
+        copied = skipped = 0
+        pk = list(table.primary_key.columns)
+
+        def flush(user_id):
+            rows = pending.pop(user_id)
+            keys = [tuple(row[c.name] for c in pk) for row in rows]
+            with router.engine_for(user_id).begin() as conn:
+                existing = {
+                    tuple(row[c.name] for c in pk): dict(row)
+                    for row in conn.execute(select(table).where(tuple_(*pk).in_(keys))).mappings()
+                }
+                fresh = []
+                for key, row in zip(keys, rows):
+                    if key not in existing:
+                        fresh.append(row)
+                    elif existing[key] != row:
+                        raise MigrationConflict(
+                            f"{table.name}: shard for user {user_id} already has a different row with key {key}"
+                        )
+                if fresh:
+                    conn.execute(table.insert(), fresh)
+            migrated.extend(keys)
+            return len(fresh)
+
+        with source.connect() as conn:
+            result = conn.execution_options(stream_results=True).execute(select(table).order_by(*pk))
+            for row in result.mappings():
+                user_id = row["user_id"]
+                if user_id is None:
+                    skipped += 1
+                    continue
+                pending[user_id].append(dict(row))
+                if len(pending[user_id]) >= batch_size:
+                    copied += flush(user_id)
+        for user_id in list(pending):
+            copied += flush(user_id)
+
+        if drop_source:
+            with source.begin() as conn:
+                for i in range(0, len(migrated), batch_size):
+                    conn.execute(table.delete().where(tuple_(*pk).in_(migrated[i:i + batch_size])))
+        totals[table.name] = copied
+        log(f"{table.name}: {copied} rows copied" + (f", {skipped} without a user_id left in place" if skipped else ""))
+    return totals
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Split the single-file tracker database into per-user shards.")
+    parser.add_argument("command", choices=["migrate"])
+    parser.add_argument("--source", default="/tmp/tracker.db")
+    parser.add_argument("--shard-dir", default="/tmp/tracker_shards")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--drop-source", action="store_true", help="delete migrated log rows from the source database")
+    args = parser.parse_args()
+    migrate_single_file(args.source, args.shard_dir, args.batch_size, args.drop_source)
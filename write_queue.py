@@ -0,0 +1,170 @@
+import collections
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+# ----------------------
+# WRITE-BEHIND QUEUE
+# ----------------------
+# All log inserts from every Streamlit session are funnelled through one
+# writer thread, which groups them into a single transaction per batch so
+# concurrent users don't fight over the SQLite write lock and a burst of
+# saves pays for one commit instead of one each.
+
+_STOP = object()
+
+
+class WriteQueue:
+    """Single writer thread that commits queued inserts in batched transactions."""
+
+    def __init__(self, session_factory, max_batch=64, max_latency=0.05, shard_key=None):
+        # With shard_key set, session_factory is called with shard_key(obj) and
+        # each batch is split into one transaction per shard.
+        self.session_factory = session_factory
+        self.shard_key = shard_key
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._commit_ms = collections.deque(maxlen=500)
+        self._wait_ms = collections.deque(maxlen=500)
+        self.batches = 0
+        self.rows = 0
+        self.failures = 0
+        self._thread = threading.Thread(target=self._run, name="tracker-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, obj):
+        """Enqueue an ORM object; the future resolves to its id once committed."""
+        future = Future()
+        self._queue.put((obj, future, time.perf_counter()))
+        return future
+
+    def add(self, obj, timeout=30):
+        """Enqueue an ORM object and block until its batch is durably committed.
+
+        Raises TimeoutError if the row is still queued after `timeout`
+        seconds; it is then withdrawn and never written, so retrying is safe.
+        A row the writer has already picked up is waited for instead.
+        """
+        future = self.submit(obj)
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            if future.cancel():
+                raise
+            return future.result()
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def metrics(self):
+        with self._lock:
+            commit_ms = sorted(self._commit_ms)
+            wait_ms = sorted(self._wait_ms)
+            batches, rows, failures = self.batches, self.rows, self.failures
+
+        def pct(values, p):
+            return values[min(len(values) - 1, int(p * len(values)))] if values else 0.0
+
+        return {
+            "queue_depth": self.depth(),
+            "batches": batches,
+            "rows": rows,
+            "failures": failures,
+            "avg_batch": rows / batches if batches else 0.0,
+            "commit_ms_p50": pct(commit_ms, 0.50),
+            "commit_ms_p95": pct(commit_ms, 0.95),
+            "ack_ms_p50": pct(wait_ms, 0.50),
+            "ack_ms_p95": pct(wait_ms, 0.95),
+        }
+
+    def close(self, timeout=None):
+        """Flush everything already queued, then stop the writer thread."""
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    # ----------------------
+    # Writer thread
+    # ----------------------
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item] if item[1].set_running_or_notify_cancel() else []
+            deadline = time.monotonic() + self.max_latency
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                if item[1].set_running_or_notify_cancel():  # False once add() gave up on it
+                    batch.append(item)
+            if batch:
+                self._write(batch)
+
+    def _write(self, batch):
+        if self.shard_key is None:
+            self._write_group(None, batch)
+            return
+        groups = {}
+        for item in batch:
+            groups.setdefault(self.shard_key(item[0]), []).append(item)
+        for key, group in groups.items():
+            self._write_group(key, group)
+
+    def _write_group(self, key, batch):
+        started = time.perf_counter()
+        try:
+            ids = self._commit(key, [obj for obj, _, _ in batch])
+        except Exception:
+            # One bad row must not fail everyone else's save: retry the batch
+            # row by row so only the offending insert reports the error.
+            for obj, future, queued_at in batch:
+                try:
+                    obj_id = self._commit(key, [obj])[0]
+                except Exception as e:
+                    with self._lock:
+                        self.failures += 1
+                    future.set_exception(e)
+                    continue
+                with self._lock:
+                    self.batches += 1
+                    self.rows += 1
+                    # Counted from the failed batch attempt: that is how long this save really took
+                    self._commit_ms.append((time.perf_counter() - started) * 1000)
+                self._settle(future, queued_at, obj_id)
+            return
+        finished = time.perf_counter()
+        with self._lock:
+            self.batches += 1
+            self.rows += len(batch)
+            self._commit_ms.append((finished - started) * 1000)
+        for (obj, future, queued_at), obj_id in zip(batch, ids):
+            self._settle(future, queued_at, obj_id)
+
+    def _commit(self, key, objs):
+        session = self.session_factory() if self.shard_key is None else self.session_factory(key)
+        try:
+            session.add_all(objs)
+            session.flush()
+            ids = [getattr(obj, "id", None) for obj in objs]
+            session.commit()
+            return ids
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def _settle(self, future, queued_at, result):
+        with self._lock:
+            self._wait_ms.append((time.perf_counter() - queued_at) * 1000)
+        future.set_result(result)